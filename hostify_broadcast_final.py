@@ -18,25 +18,693 @@ Fecha: 2025-06-10
 """
 
 import requests
+import argparse
 import datetime
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union, Deque
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import re
+import sqlite3
+import threading
 import time
+import cProfile
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+from urllib.parse import urlencode, urlparse
 
 # Cargar variables de entorno
 load_dotenv()
 
+DateLike = Union[str, datetime.date]
+
+def to_iso_date(value: DateLike) -> str:
+    """Normaliza una fecha (date o 'YYYY-MM-DD') a texto ISO comparable"""
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)[:10]
+
+def is_iso_date(value: str) -> bool:
+    """Validación rápida de formato YYYY-MM-DD (sin strptime)"""
+    return len(value) == 10 and value[4] == "-" and value[7] == "-" and value[:4].isdigit()
+
+def tagged_path(path: str, *tags: Optional[str]) -> str:
+    """Inserta etiquetas antes de la extensión: ('progreso.json', 'madrid') -> 'progreso.madrid.json'"""
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return path
+    path = Path(path)
+    return str(path.with_name(".".join([path.stem, *tags]) + path.suffix))
+
+class RunProfiler:
+    """
+    Perfilado por etapas de una ejecución: tiempo real (wall), CPU y memoria.
+    
+    Cada etapa (discovery, fetch, http, json, enrich, chekin, render, send,
+    save_progress) acumula llamadas, tiempo total y tiempo propio (sin contar
+    etapas anidadas: el tiempo propio de fetch es el filtrado de reservas, sin
+    su http/json/enrich). El CPU es por hilo (thread_time). Opcionalmente registra memoria con tracemalloc y
+    un perfil cProfile del hilo principal en un archivo .prof.
+    
+    Desactivado (por defecto) no mide nada y stage() no tiene coste apreciable.
+    """
+    
+    def __init__(self, enabled: bool = False, trace_memory: bool = False, cprofile_path: Optional[str] = None):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.cprofile_path = cprofile_path if enabled else None
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._started_at = None
+        self._wall_total = 0.0
+        self._top_allocations: List[str] = []
+        self._peak_memory = 0
+    
+    def start(self):
+        """Empieza a medir la ejecución"""
+        
+        if not self.enabled:
+            return
+        self._started_at = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+    
+    def stop(self):
+        """Termina la medición (guarda cProfile y snapshot de memoria si aplica)"""
+        
+        if not self.enabled or self._started_at is None:
+            return
+        self._wall_total = time.perf_counter() - self._started_at
+        
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            print(f"🧪 Perfil cProfile guardado en: {self.cprofile_path}")
+            self._cprofile = None
+        
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self._top_allocations = [str(stat) for stat in snapshot.statistics("lineno")[:10]]
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Mide una etapa (se puede anidar)"""
+        
+        if not self.enabled:
+            yield
+            return
+        
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        
+        # [tiempo hijos wall, tiempo hijos cpu]
+        frame = [0.0, 0.0]
+        stack.append(frame)
+        memory_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            memory_delta = tracemalloc.get_traced_memory()[0] - memory_before if self.trace_memory else 0
+            stack.pop()
+            if stack:
+                stack[-1][0] += wall
+                stack[-1][1] += cpu
+            
+            with self._lock:
+                stats = self.stats.setdefault(name, {
+                    "calls": 0, "wall": 0.0, "wall_self": 0.0, "cpu": 0.0, "cpu_self": 0.0, "memory_delta": 0
+                })
+                stats["calls"] += 1
+                stats["wall"] += wall
+                stats["wall_self"] += wall - frame[0]
+                stats["cpu"] += cpu
+                stats["cpu_self"] += cpu - frame[1]
+                stats["memory_delta"] += memory_delta
+    
+    def report(self) -> Dict[str, Any]:
+        """Desglose por etapa (ordenado por tiempo propio)"""
+        
+        stages = {
+            name: {key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()}
+            for name, stats in sorted(self.stats.items(), key=lambda item: -item[1]["wall_self"])
+        }
+        report = {"wall_total": round(self._wall_total, 4), "stages": stages}
+        if self.trace_memory or self._top_allocations:
+            report["peak_memory"] = self._peak_memory
+            report["top_allocations"] = self._top_allocations
+        if self.cprofile_path:
+            report["cprofile_path"] = self.cprofile_path
+        return report
+    
+    def print_report(self):
+        """Muestra el desglose por etapa"""
+        
+        if not self.enabled:
+            return
+        
+        report = self.report()
+        print(f"\n{'='*60}")
+        print(f"🧪 PERFIL DE LA EJECUCIÓN ({report['wall_total']:.2f}s)")
+        print(f"{'='*60}")
+        print(f"{'Etapa':<15}{'Llamadas':>9}{'Wall':>10}{'Propio':>10}{'CPU':>10}{'Memoria':>12}")
+        for name, stats in report["stages"].items():
+            print(f"{name:<15}{stats['calls']:>9}{stats['wall']:>9.2f}s{stats['wall_self']:>9.2f}s"
+                  f"{stats['cpu_self']:>9.2f}s{stats['memory_delta'] / 1024:>10.0f}KB")
+        if "peak_memory" in report:
+            print(f"📈 Pico de memoria: {report['peak_memory'] / 1024 / 1024:.1f} MB")
+            for line in report["top_allocations"][:5]:
+                print(f"   {line}")
+
+class ChekinUnavailableError(Exception):
+    """Chekin no respondió (fallo, timeout o circuito abierto): la reserva se aplaza"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker para dependencias externas.
+    
+    - CLOSED: las llamadas pasan; N fallos consecutivos abren el circuito
+    - OPEN: las llamadas se cortan sin tocar la red durante el periodo de enfriamiento
+    - HALF_OPEN: se deja pasar una llamada de prueba; si va bien se cierra, si falla se reabre
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 60.0, fail_fast: bool = False):
+        """
+        Args:
+            name: Nombre de la dependencia (para logs)
+            failure_threshold: Fallos consecutivos que abren el circuito
+            recovery_timeout: Segundos en OPEN antes de probar recuperación
+            fail_fast: Si True, una vez abierto no vuelve a probar en toda la ejecución
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.fail_fast = fail_fast
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        """Indica si se puede hacer la llamada ahora"""
+        
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            
+            if self.state == self.OPEN:
+                if self.fail_fast or time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                print(f"🔌 {self.name}: circuito HALF-OPEN - probando recuperación")
+            
+            # HALF_OPEN: una sola llamada de prueba a la vez
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+    
+    def record_success(self):
+        """Registra una llamada correcta"""
+        
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"🔌 {self.name}: circuito CERRADO - servicio recuperado")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+    
+    def record_failure(self):
+        """Registra un fallo o timeout"""
+        
+        with self._lock:
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 {self.name}: circuito ABIERTO tras {self.consecutive_failures} fallos consecutivos")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class CassetteMissError(Exception):
+    """La petición no está grabada en el cassette (modo replay)"""
+
+class CassetteResponse:
+    """Respuesta reconstruida desde un cassette (imita lo que usamos de requests.Response)"""
+    
+    def __init__(self, status_code: int, body: Any = None, url: str = ""):
+        self.status_code = status_code
+        self.body = body
+        self.url = url
+    
+    @property
+    def text(self) -> str:
+        return self.body if isinstance(self.body, str) else json.dumps(self.body, ensure_ascii=False)
+    
+    def json(self) -> Any:
+        if isinstance(self.body, str):
+            return json.loads(self.body)
+        return self.body
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error (cassette) for url: {self.url}", response=self)
+
+class HttpTransport:
+    """
+    Transporte HTTP real bajo HostifyAPI y ChekinConnector.
+    
+    Las subclases graban (RecordingTransport) o reproducen (ReplayTransport) las
+    peticiones en un cassette para pruebas de rendimiento sin red.
+    """
+    
+    mode = "live"
+    # Las peticiones a estas rutas nunca se envían en modo grabación/replay
+    BLOCKED_PATHS = ("/inbox/reply",)
+    blocks_sends = False
+    
+    def __init__(self, session: Optional[requests.Session] = None):
+        self.session = session or requests.Session()
+        self.blocked_requests = 0
+    
+    def request(self, method: str, url: str, **kwargs):
+        return self.session.request(method, url, **kwargs)
+    
+    def today(self) -> datetime.date:
+        """Fecha de referencia para las ventanas de check-in (en replay, la de la grabación)"""
+        return datetime.datetime.now().date()
+    
+    @classmethod
+    def request_key(cls, method: str, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Clave de emparejamiento: método + URL + query ordenada"""
+        
+        query = urlencode(sorted((str(key), str(value)) for key, value in (params or {}).items()))
+        return f"{method.upper()} {url}" + (f"?{query}" if query else "")
+    
+    def _is_blocked(self, url: str) -> bool:
+        return self.blocks_sends and urlparse(url).path.endswith(self.BLOCKED_PATHS)
+    
+    def _blocked_response(self, method: str, url: str) -> CassetteResponse:
+        self.blocked_requests += 1
+        print(f"🚫 [{self.mode}] {method.upper()} {urlparse(url).path} bloqueado (no se envía nada)")
+        return CassetteResponse(200, {"success": True, "blocked_by_transport": self.mode}, url)
+
+class RecordingTransport(HttpTransport):
+    """
+    Hace las peticiones reales y las guarda en un cassette JSONL (una interacción por línea).
+    
+    Las API keys, tokens y cabeceras de autenticación se sustituyen por REDACTED antes
+    de escribir. Por defecto bloquea también /inbox/reply, para grabar tráfico real sin
+    escribir a ningún huésped.
+    """
+    
+    mode = "record"
+    SECRET_HEADERS = {"x-api-key", "authorization"}
+    SECRET_FIELDS = {"api_key", "token", "jwt", "access_token", "refresh_token", "password"}
+    REDACTED = "REDACTED"
+    
+    def __init__(self, cassette_path: str, session: Optional[requests.Session] = None, block_sends: bool = True):
+        """
+        Args:
+            cassette_path: Archivo de cassette (se añaden interacciones al final)
+            session: Sesión HTTP a usar (por defecto una nueva)
+            block_sends: Si True, /inbox/reply no se envía ni se graba
+        """
+        super().__init__(session)
+        self.cassette_path = cassette_path
+        self.blocks_sends = block_sends
+        self.recorded = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def redact(cls, value: Any) -> Any:
+        """Copia de un cuerpo JSON con los campos secretos sustituidos"""
+        
+        if isinstance(value, dict):
+            return {key: cls.REDACTED if str(key).lower() in cls.SECRET_FIELDS else cls.redact(item)
+                    for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls.redact(item) for item in value]
+        return value
+    
+    def request(self, method: str, url: str, **kwargs):
+        if self._is_blocked(url):
+            return self._blocked_response(method, url)
+        
+        interaction = {
+            "key": self.request_key(method, url, kwargs.get("params")),
+            "method": method.upper(),
+            "url": url,
+            "params": kwargs.get("params"),
+            "headers": {key: self.REDACTED if key.lower() in self.SECRET_HEADERS else value
+                        for key, value in (kwargs.get("headers") or {}).items()},
+            "json": self.redact(kwargs.get("json")),
+            # Las consultas llevan la fecha del día (checkIn_gte): el replay la reutiliza
+            "recorded_on": self.today().isoformat(),
+        }
+        
+        started = time.monotonic()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            interaction.update(elapsed=time.monotonic() - started, error=type(e).__name__, message=str(e))
+            self._write(interaction)
+            raise
+        
+        try:
+            body = self.redact(response.json())
+        except ValueError:
+            body = response.text
+        interaction.update(elapsed=time.monotonic() - started, status_code=response.status_code, body=body)
+        self._write(interaction)
+        return response
+    
+    def _write(self, interaction: Dict[str, Any]):
+        with self._lock, open(self.cassette_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+class ReplayTransport(HttpTransport):
+    """
+    Reproduce un cassette sin red: cada petición recibe la siguiente respuesta grabada
+    con la misma clave (método + URL + query); agotadas, se repite la última.
+    "Hoy" es la fecha de la grabación, así las consultas por fecha coinciden con las
+    grabadas aunque el replay se haga otro día.
+    
+    La latencia grabada se respeta multiplicada por latency_scale (0 = sin espera).
+    Las peticiones a /inbox/reply se bloquean siempre.
+    """
+    
+    mode = "replay"
+    blocks_sends = True
+    
+    def __init__(self, cassette_path: str, latency_scale: float = 1.0):
+        """
+        Args:
+            cassette_path: Cassette grabado con RecordingTransport
+            latency_scale: Factor sobre la latencia original (1.0 = igual, 0.5 = el doble de rápido)
+        """
+        super().__init__()
+        self.cassette_path = cassette_path
+        self.latency_scale = latency_scale
+        self.replayed = 0
+        self.misses = 0
+        self.recorded_on: Optional[datetime.date] = None
+        self._interactions: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        
+        with open(cassette_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions.setdefault(interaction["key"], []).append(interaction)
+                    if self.recorded_on is None and interaction.get("recorded_on"):
+                        self.recorded_on = datetime.date.fromisoformat(interaction["recorded_on"])
+        
+        print(f"📼 Replay de {sum(len(items) for items in self._interactions.values())} interacciones "
+              f"desde {cassette_path} (latencia x{latency_scale})")
+    
+    def request(self, method: str, url: str, **kwargs):
+        if self._is_blocked(url):
+            return self._blocked_response(method, url)
+        
+        key = self.request_key(method, url, kwargs.get("params"))
+        with self._lock:
+            queue = self._interactions.get(key)
+            if not queue:
+                self.misses += 1
+                raise CassetteMissError(f"Petición no grabada en el cassette: {key}")
+            interaction = queue.pop(0) if len(queue) > 1 else queue[0]
+            self.replayed += 1
+        
+        if self.latency_scale > 0:
+            time.sleep(interaction.get("elapsed", 0) * self.latency_scale)
+        
+        if "error" in interaction:
+            error_class = getattr(requests.exceptions, interaction["error"], requests.exceptions.RequestException)
+            raise error_class(interaction.get("message", ""))
+        return CassetteResponse(interaction["status_code"], interaction.get("body"), url)
+    
+    def today(self) -> datetime.date:
+        return self.recorded_on or super().today()
+
+class AccountScheduler:
+    """
+    Reparto justo de peticiones HTTP entre cuentas que se procesan a la vez.
+    
+    Como mucho max_concurrent peticiones en vuelo entre todas las cuentas; cuando
+    hay cola, cada hueco libre se da por turno rotatorio a la siguiente cuenta que
+    está esperando, así una cuenta con muchos listings no deja sin turno a las demás.
+    """
+    
+    def __init__(self, max_concurrent: int = 8):
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.granted: Dict[str, int] = {}
+        self._waiting: Dict[str, Deque[threading.Event]] = {}
+        self._turns: Deque[str] = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self, account: str):
+        """Espera turno para una petición de la cuenta"""
+        
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._turns:
+                self.in_flight += 1
+                self.granted[account] = self.granted.get(account, 0) + 1
+                return
+            event = threading.Event()
+            self._waiting.setdefault(account, deque()).append(event)
+            if account not in self._turns:
+                self._turns.append(account)
+        event.wait()
+    
+    def release(self):
+        """Libera el hueco y se lo pasa a la siguiente cuenta en espera"""
+        
+        with self._lock:
+            if not self._turns:
+                self.in_flight -= 1
+                return
+            account = self._turns.popleft()
+            waiting = self._waiting[account]
+            event = waiting.popleft()
+            if waiting:
+                self._turns.append(account)
+            self.granted[account] = self.granted.get(account, 0) + 1
+        event.set()
+    
+    @contextmanager
+    def slot(self, account: str):
+        self.acquire(account)
+        try:
+            yield
+        finally:
+            self.release()
+
+class ScheduledTransport:
+    """Transporte de una cuenta que pide turno al AccountScheduler antes de cada petición"""
+    
+    def __init__(self, transport: HttpTransport, scheduler: AccountScheduler, account: str):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.account = account
+    
+    def __getattr__(self, name: str):
+        # mode, blocks_sends, session, ... del transporte real
+        return getattr(self.transport, name)
+    
+    def request(self, method: str, url: str, **kwargs):
+        with self.scheduler.slot(self.account):
+            return self.transport.request(method, url, **kwargs)
+
+class CallBudgetExceeded(Exception):
+    """Se agotó el presupuesto de llamadas de un endpoint: la ejecución se detiene"""
+
+class CallBudget:
+    """
+    Contador de llamadas por endpoint (listings, reservations, detail, inbox,
+    inbox_reply, chekin) con límite duro opcional.
+    
+    Al pedir una llamada por encima del límite se lanza CallBudgetExceeded y el
+    presupuesto queda marcado como agotado; broadcast_campaigns lo comprueba y
+    se detiene guardando el progreso.
+    """
+    
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = dict(limits or {})
+        self.calls: Dict[str, int] = {}
+        self.exhausted_endpoint: Optional[str] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def exhausted(self) -> bool:
+        return self.exhausted_endpoint is not None
+    
+    def allows(self, endpoint: str, calls: int = 1) -> bool:
+        """Indica si quedan al menos `calls` llamadas para el endpoint"""
+        limit = self.limits.get(endpoint)
+        return limit is None or self.calls.get(endpoint, 0) + calls <= limit
+    
+    def spend(self, endpoint: str):
+        """Cuenta una llamada (CallBudgetExceeded si no queda presupuesto)"""
+        
+        with self._lock:
+            if not self.allows(endpoint):
+                self.exhausted_endpoint = endpoint
+                raise CallBudgetExceeded(f"Presupuesto de llamadas a {endpoint} agotado ({self.limits[endpoint]})")
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+class RequestHedger:
+    """
+    Peticiones "hedged" para GETs idempotentes: si una petición no ha respondido
+    al llegar al p95 observado de su endpoint, se lanza un duplicado y se usa la
+    primera respuesta correcta (la otra se descarta al terminar).
+    
+    Los duplicados se limitan a max_extra_load de las peticiones (0.05 = como
+    mucho un 5% más de carga). Nunca se duplica nada que no sea GET ni los
+    endpoints fuera de HEDGEABLE (en particular /inbox/reply).
+    """
+    
+    HEDGEABLE = {"listings", "reservations", "detail", "inbox", "chekin"}
+    
+    def __init__(self, max_extra_load: float = 0.05, min_samples: int = 20, window: int = 200,
+                 max_workers: int = 8):
+        """
+        Args:
+            max_extra_load: Proporción máxima de peticiones duplicadas
+            min_samples: Latencias observadas de un endpoint antes de duplicar
+            window: Últimas latencias por endpoint con las que se calcula el p95
+            max_workers: Hilos para las peticiones en vuelo
+        """
+        self.max_extra_load = max_extra_load
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+    
+    def p95(self, endpoint: str) -> Optional[float]:
+        """p95 de latencia del endpoint, o None si aún hay pocas muestras"""
+        
+        with self._lock:
+            samples = sorted(self._latencies.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    
+    def _record(self, endpoint: str, started: float):
+        with self._lock:
+            self._latencies.setdefault(endpoint, deque(maxlen=self._window)).append(time.monotonic() - started)
+    
+    def _submit(self, endpoint: str, call: Callable[[], Any]):
+        started = time.monotonic()
+        future = self._executor.submit(call)
+        future.add_done_callback(lambda f: f.exception() is None and self._record(endpoint, started))
+        return future
+    
+    def call(self, endpoint: str, method: str, call: Callable[[], Any]) -> Any:
+        """Hace la petición (call) duplicándola si tarda más del p95 del endpoint"""
+        
+        if method.upper() != "GET" or endpoint not in self.HEDGEABLE:
+            return call()
+        
+        with self._lock:
+            self.requests += 1
+        
+        delay = self.p95(endpoint)
+        primary = self._submit(endpoint, call)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        
+        with self._lock:
+            allowed = self.hedged < self.max_extra_load * self.requests
+            if allowed:
+                self.hedged += 1
+        if not allowed:
+            return primary.result()
+        
+        hedge = self._submit(endpoint, call)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        # Fallaron las dos: se propaga el error de la original
+        return primary.result()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "extra_load": self.hedged / self.requests if self.requests else 0.0,
+            "p95": {endpoint: self.p95(endpoint) for endpoint in self._latencies}
+        }
+
 class ChekinConnector:
     """Conector para la API de Chekin con autenticación JWT oficial"""
     
-    def __init__(self):
-        self.api_key = os.getenv("CHEKIN_API_KEY")
+    def __init__(self, timeout: float = 10, failure_threshold: int = 5,
+                 recovery_timeout: float = 60.0, fail_fast: bool = False,
+                 transport: Optional[HttpTransport] = None, api_key: Optional[str] = None,
+                 hedger: Optional[RequestHedger] = None, call_budget: Optional[CallBudget] = None):
+        """
+        Args:
+            timeout: Timeout (segundos) de cada consulta a Chekin
+            failure_threshold: Fallos/timeouts consecutivos que abren el circuito
+            recovery_timeout: Segundos de enfriamiento antes de una consulta de prueba
+            fail_fast: Si True, con el circuito abierto no se vuelve a probar en esta ejecución
+            transport: Transporte HTTP (grabación/replay); por defecto peticiones reales
+            api_key: API key de Chekin (por defecto CHEKIN_API_KEY del entorno)
+            hedger: Duplica las consultas lentas de reservas (None = sin duplicar)
+            call_budget: Contador/límite de llamadas (endpoint "chekin")
+        """
+        self.api_key = api_key or os.getenv("CHEKIN_API_KEY")
         self.base_url = "https://a.chekin.io/public/api/v1"
         self.jwt_token = None
         self.is_available = False
+        self.timeout = timeout
+        self.breaker = CircuitBreaker("Chekin", failure_threshold, recovery_timeout, fail_fast)
+        self.transport = transport or HttpTransport()
+        self.hedger = hedger
+        self.call_budget = call_budget or CallBudget()
         
         if not self.api_key:
             print("⚠️ CHEKIN_API_KEY no está configurada en las variables de entorno")
@@ -58,7 +726,7 @@ class ChekinConnector:
         payload = {"api_key": self.api_key}
         
         try:
-            response = requests.post(auth_url, headers=headers, json=payload, timeout=10)
+            response = self.transport.request("POST", auth_url, headers=headers, json=payload, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -76,11 +744,22 @@ class ChekinConnector:
             return False
     
     def get_checkin_link(self, hostify_reservation_id: str) -> Optional[str]:
-        """Obtiene link de check-in usando external_id (ID de Hostify)"""
+        """
+        Obtiene link de check-in usando external_id (ID de Hostify)
+        
+        Returns:
+            El link, o None si Chekin no tiene link para la reserva
+        
+        Raises:
+            ChekinUnavailableError: Chekin falló o el circuito está abierto (reserva aplazada)
+        """
         
         if not self.is_available or not self.jwt_token:
             return None
         
+        if not self.breaker.allow_request():
+            raise ChekinUnavailableError(f"Circuito de Chekin abierto - reserva {hostify_reservation_id} aplazada")
+        
         try:
             headers = {
                 "Authorization": f"JWT {self.jwt_token}",
@@ -92,13 +771,23 @@ class ChekinConnector:
                 "limit": 1
             }
             
-            response = requests.get(
-                f"{self.base_url}/reservations",
-                headers=headers,
-                params=params,
-                timeout=10
-            )
+            def fetch():
+                self.call_budget.spend("chekin")
+                return self.transport.request(
+                    "GET",
+                    f"{self.base_url}/reservations",
+                    headers=headers,
+                    params=params,
+                    timeout=self.timeout
+                )
+            
+            response = self.hedger.call("chekin", "GET", fetch) if self.hedger else fetch()
+            
+            # Errores de servidor o de cuota cuentan como caída del servicio
+            if response.status_code >= 500 or response.status_code == 429:
+                raise ChekinUnavailableError(f"Chekin respondió {response.status_code}")
             
+            signup_link = None
             if response.status_code == 200:
                 data = response.json()
                 reservations = data.get("results", [])
@@ -106,22 +795,393 @@ class ChekinConnector:
                 if reservations:
                     reservation = reservations[0]
                     # signup_form_link es el link de check-in real
-                    signup_link = reservation.get("signup_form_link", "")
-                    if signup_link and signup_link.startswith("http"):
-                        return signup_link
+                    link = reservation.get("signup_form_link", "")
+                    if link and link.startswith("http"):
+                        signup_link = link
             
-            return None
+            self.breaker.record_success()
+            return signup_link
+        
+        except CallBudgetExceeded:
+            # No es una caída de Chekin: no cuenta para el circuit breaker
+            raise
             
         except Exception as e:
+            self.breaker.record_failure()
             print(f"⚠️ Error consultando Chekin para ID {hostify_reservation_id}: {str(e)}")
-            return None
+            if isinstance(e, ChekinUnavailableError):
+                raise
+            raise ChekinUnavailableError(str(e)) from e
+
+class ReservationRecord:
+    """Reserva compacta: solo los campos que usa el envío de mensajes (sin payloads crudos)"""
+    
+    __slots__ = (
+        "id", "listing_id", "message_id", "inbox_id", "status",
+        "checkin", "checkout", "guests", "source", "guest_name", "property_name"
+    )
+    
+    # Campos candidatos en la reserva (orden de preferencia)
+    GUEST_NAME_FIELDS = ["guest_name", "guestName", "guest", "primary_guest", "customer_name"]
+    PROPERTY_NAME_FIELDS = ["name", "title", "property_name", "listing_name"]
+    
+    def __init__(self, id, listing_id=None, message_id=None, inbox_id=None, status=None,
+                 checkin=None, checkout=None, guests=None, source=None,
+                 guest_name=None, property_name=None):
+        self.id = id
+        self.listing_id = listing_id
+        self.message_id = message_id
+        self.inbox_id = inbox_id
+        self.status = status
+        self.checkin = checkin
+        self.checkout = checkout
+        self.guests = guests
+        self.source = source
+        self.guest_name = guest_name
+        self.property_name = property_name
+    
+    @classmethod
+    def trim_details(cls, details: Dict[str, Any]) -> Dict[str, Any]:
+        """Subconjunto del detalle de /reservations/{id} que usa el registro"""
+        
+        guest = details.get("guest") or {}
+        listing = details.get("listing") or {}
+        return {
+            "guest": {field: guest[field] for field in ("first_name", "name", "last_name") if field in guest},
+            "listing": {field: listing[field] for field in cls.PROPERTY_NAME_FIELDS if field in listing}
+        }
+    
+    @classmethod
+    def from_api(cls, reservation: Dict[str, Any], details: Optional[Dict[str, Any]] = None,
+                 listing_id=None) -> "ReservationRecord":
+        """Construye el registro a partir de la reserva de /reservations y su detalle (opcional)"""
+        
+        details = details or {}
+        
+        return cls(
+            id=reservation.get("id"),
+            listing_id=reservation.get("listing_id") or listing_id,
+            message_id=reservation.get("message_id"),
+            inbox_id=reservation.get("inbox_id"),
+            status=reservation.get("status"),
+            checkin=reservation.get("checkIn"),
+            checkout=reservation.get("checkOut"),
+            guests=reservation.get("guests"),
+            source=reservation.get("source"),
+            guest_name=cls._parse_guest_name(reservation, details.get("guest") or {}),
+            property_name=cls._parse_property_name(reservation, details.get("listing") or {})
+        )
+    
+    @classmethod
+    def _parse_guest_name(cls, reservation: Dict[str, Any], detailed_guest: Dict[str, Any]) -> Optional[str]:
+        """Nombre del huésped con múltiples fallbacks"""
+        
+        for field in cls.GUEST_NAME_FIELDS:
+            name = reservation.get(field)
+            if name and isinstance(name, str) and name.strip():
+                return name.strip()
+        
+        # Buscar en datos detallados
+        if detailed_guest:
+            first_name = detailed_guest.get("first_name") or detailed_guest.get("name")
+            if first_name:
+                last_name = detailed_guest.get("last_name", "")
+                return f"{first_name} {last_name}".strip()
+        
+        return None
+    
+    @classmethod
+    def _parse_property_name(cls, reservation: Dict[str, Any], property_details: Dict[str, Any]) -> Optional[str]:
+        """Nombre de la propiedad desde la reserva o el detalle del listing"""
+        
+        for field in cls.PROPERTY_NAME_FIELDS:
+            name = reservation.get(field) or property_details.get(field)
+            if name and isinstance(name, str) and name.strip():
+                return name.strip()
+        
+        return None
+    
+    def __repr__(self) -> str:
+        return f"ReservationRecord(id={self.id!r}, listing_id={self.listing_id!r}, checkin={self.checkin!r})"
+
+class ListingInfo:
+    """Metadatos de un listing obtenidos en el descubrimiento (sin llamadas adicionales)"""
+    
+    __slots__ = ("id", "name", "parent_id", "channel", "is_listed")
+    
+    # fs_integration_type → canal
+    CHANNELS = {22: "Booking.com", 26: "Vrbo", 1: "Airbnb"}
+    # Canal de los listings PARENT (propiedad en Hostify)
+    DIRECT_CHANNEL = "Directo"
+    
+    def __init__(self, id, name=None, parent_id=None, channel=None, is_listed=True):
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.channel = channel
+        self.is_listed = is_listed
+    
+    @classmethod
+    def from_parent(cls, listing: Dict[str, Any]) -> "ListingInfo":
+        return cls(listing.get("id"), name=listing.get("name"), channel=cls.DIRECT_CHANNEL)
+    
+    @classmethod
+    def from_child(cls, listing: Dict[str, Any], parent: "ListingInfo") -> "ListingInfo":
+        return cls(
+            listing.get("id"),
+            # El child suele tener el mismo nombre; si no lo trae se usa el del parent
+            name=listing.get("name") or parent.name,
+            parent_id=parent.id,
+            channel=cls.CHANNELS.get(listing.get("fs_integration_type"), "Desconocido"),
+            is_listed=listing.get("is_listed", 0) == 1
+        )
+    
+    @property
+    def integration_name(self) -> str:
+        """Nombre del canal para mostrar (marca los Airbnb no listados)"""
+        if self.channel == "Airbnb" and not self.is_listed:
+            return "Airbnb (no listado)"
+        return self.channel
+
+class ReservationDetailCache:
+    """
+    Caché persistente (SQLite) de los detalles de /reservations/{id}.
+    
+    Solo guarda los campos del detalle que usa ReservationRecord. Una entrada
+    se descarta si supera el TTL o si el listado de reservas trae un estado,
+    fechas o número de huéspedes distinto al que tenía al guardarse.
+    """
+    
+    # Campos del listado que, si cambian, invalidan el detalle guardado
+    FINGERPRINT_FIELDS = ("status", "checkIn", "checkOut", "guests")
+    
+    def __init__(self, path: str = "reservation_cache.sqlite3", ttl_seconds: float = 3 * 24 * 3600):
+        """
+        Args:
+            path: Archivo SQLite de la caché
+            ttl_seconds: Antigüedad máxima de una entrada
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS reservation_details (
+                   reservation_id TEXT PRIMARY KEY,
+                   fingerprint TEXT NOT NULL,
+                   details TEXT NOT NULL,
+                   fetched_at REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+    
+    @classmethod
+    def _fingerprint(cls, reservation: Dict[str, Any]) -> str:
+        return json.dumps([reservation.get(field) for field in cls.FINGERPRINT_FIELDS], default=str)
+    
+    def get(self, reservation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Detalle guardado de la reserva, o None si no existe, caducó o la reserva cambió"""
+        
+        reservation_id = str(reservation.get("id"))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, details, fetched_at FROM reservation_details WHERE reservation_id = ?",
+                (reservation_id,)
+            ).fetchone()
+        
+        if row:
+            fingerprint, details, fetched_at = row
+            if fingerprint == self._fingerprint(reservation) and time.time() - fetched_at <= self.ttl_seconds:
+                self.hits += 1
+                return json.loads(details)
+            self.invalidate(reservation_id)
+        
+        self.misses += 1
+        return None
+    
+    def put(self, reservation: Dict[str, Any], details: Dict[str, Any]):
+        """Guarda (o reemplaza) el detalle de una reserva"""
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reservation_details VALUES (?, ?, ?, ?)",
+                (str(reservation.get("id")), self._fingerprint(reservation),
+                 json.dumps(details, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+    
+    def invalidate(self, reservation_id: str):
+        """Elimina la entrada de una reserva"""
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM reservation_details WHERE reservation_id = ?", (str(reservation_id),))
+            self._conn.commit()
+    
+    def fresh_entries(self) -> int:
+        """Entradas aún dentro del TTL (para estimar aciertos en plan_broadcast)"""
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM reservation_details WHERE fetched_at >= ?", (time.time() - self.ttl_seconds,)
+            ).fetchone()
+        return row[0]
+    
+    def clear(self):
+        """Vacía la caché"""
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM reservation_details")
+            self._conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Aciertos y fallos de la caché en esta ejecución"""
+        
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class InboxIndex:
+    """
+    Índice de mensajes salientes recientes por hilo del inbox (el thread_id de /inbox/reply),
+    construido en bloque con el listado paginado de /inbox.
+    
+    Permite saber, sin una llamada por reserva, si un hilo ya tiene un mensaje
+    concreto (por hash del texto normalizado) o un mensaje generado con una
+    plantilla (cada variable {{...}} acepta una sola palabra, y la plantilla
+    debe tener texto fijo).
+    """
+    
+    # Id del hilo en el listado de /inbox (el primero presente): el thread_id de /inbox/reply
+    THREAD_ID_FIELDS = ("thread_id", "id")
+    MESSAGE_TEXT_FIELDS = ("message", "body", "text", "content")
+    
+    def __init__(self):
+        # hilo → textos normalizados de los mensajes salientes
+        self.messages: Dict[str, List[str]] = {}
+        self._hashes: Dict[str, set] = {}
+        self._template_patterns: Dict[str, Optional["re.Pattern"]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(str(text).split())
+    
+    @classmethod
+    def message_hash(cls, text: str) -> str:
+        return hashlib.sha256(cls.normalize(text).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _is_outbound(message: Dict[str, Any]) -> bool:
+        """Mensaje enviado por el anfitrión (si el listado no indica dirección, se incluye)"""
+        
+        if "is_incoming" in message:
+            return not message["is_incoming"]
+        if "direction" in message:
+            return str(message["direction"]).lower() in ("out", "outgoing", "outbound")
+        if "from" in message:
+            return str(message["from"]).lower() in ("host", "owner", "manager")
+        return True
+    
+    def add_thread(self, thread: Dict[str, Any]):
+        """Indexa un hilo del listado (sus mensajes, o last_message si no vienen)"""
+        
+        messages = thread.get("messages")
+        if not isinstance(messages, list):
+            messages = [thread["last_message"]] if isinstance(thread.get("last_message"), dict) else []
+        
+        texts = []
+        for message in messages:
+            if not isinstance(message, dict) or not self._is_outbound(message):
+                continue
+            text = next((message[field] for field in self.MESSAGE_TEXT_FIELDS if message.get(field)), None)
+            if text:
+                texts.append(text)
+        
+        # Solo bajo su propio id: otros campos pueden coincidir con el id de otro hilo
+        thread_id = next((thread[field] for field in self.THREAD_ID_FIELDS if thread.get(field)), None)
+        if thread_id:
+            for text in texts:
+                self.add(thread_id, text)
+    
+    def add(self, thread_id, text: str):
+        """Registra un mensaje saliente (también los enviados en esta ejecución)"""
+        
+        key = str(thread_id)
+        with self._lock:
+            hashes = self._hashes.setdefault(key, set())
+            digest = self.message_hash(text)
+            if digest not in hashes:
+                hashes.add(digest)
+                self.messages.setdefault(key, []).append(self.normalize(text))
+    
+    def contains(self, thread_id, text: str) -> bool:
+        """El hilo ya tiene exactamente este mensaje"""
+        return self.message_hash(text) in self._hashes.get(str(thread_id), ())
+    
+    def matches_template(self, thread_id, template: str) -> bool:
+        """
+        El hilo ya tiene un mensaje generado con esta plantilla (antes de renderizarla).
+        
+        Es una comprobación previa conservadora: cada variable acepta una sola palabra
+        y una plantilla sin texto fijo nunca coincide. Los valores de varias palabras
+        no coinciden aquí y se comprueban después con el mensaje renderizado (contains).
+        """
+        
+        texts = self.messages.get(str(thread_id))
+        if not texts:
+            return False
+        if template not in self._template_patterns:
+            parts = re.split(r"\{\{\s*\w+\s*\}\}", self.normalize(template))
+            has_literal_text = any(re.search(r"\w", part) for part in parts)
+            self._template_patterns[template] = (
+                re.compile(r"\S+?".join(re.escape(part) for part in parts)) if has_literal_text else None
+            )
+        pattern = self._template_patterns[template]
+        return pattern is not None and any(pattern.fullmatch(text) for text in texts)
+    
+    def __len__(self) -> int:
+        return len(self._hashes)
 
 class HostifyAPI:
     """API de Hostify con extracción inteligente de datos"""
     
-    def __init__(self):
+    # Timeouts (conexión, lectura) en segundos por familia de endpoints
+    DEFAULT_TIMEOUTS = {
+        "listings": (5, 30),      # /listings y /listings/children/{id}
+        "reservations": (5, 30),  # /reservations (listado paginado)
+        "detail": (5, 15),        # /reservations/{id}
+        "inbox": (5, 30),         # /inbox (listado paginado de hilos)
+        "inbox_reply": (5, 30),   # /inbox/reply
+    }
+    
+    # per_page que se pide de entrada; se reduce si el endpoint acepta menos
+    MAX_PER_PAGE = 100
+    # Tamaño de página que devuelven algunos endpoints aunque se pida más (sin `total`)
+    DEFAULT_PAGE_CAPS = {"children": 20}
+    
+    def __init__(self, timeouts: Optional[Dict[str, Tuple[float, float]]] = None, max_workers: int = 4,
+                 detail_cache: Optional[ReservationDetailCache] = None, profiler: Optional[RunProfiler] = None,
+                 transport: Optional[HttpTransport] = None, api_key: Optional[str] = None,
+                 hedger: Optional[RequestHedger] = None, call_budget: Optional[CallBudget] = None):
+        """
+        Args:
+            timeouts: Timeouts (conexión, lectura) por familia de endpoints; se
+                combinan con DEFAULT_TIMEOUTS
+            max_workers: Páginas que se piden en paralelo
+            detail_cache: Caché persistente de detalles de reserva (None = sin caché)
+            profiler: Perfilado por etapas (http, json, enrich)
+            transport: Transporte HTTP (grabación/replay); por defecto peticiones reales
+            api_key: API key de Hostify (por defecto HOSTIFY_API_KEY del entorno)
+            hedger: Duplica los GETs lentos (None = sin duplicar); nunca /inbox/reply
+            call_budget: Contador/límite de llamadas por familia de endpoints
+        """
         self.base_url = "https://api-rms.hostify.com"
-        self.api_key = os.getenv("HOSTIFY_API_KEY")
+        self.api_key = api_key or os.getenv("HOSTIFY_API_KEY")
         
         if not self.api_key:
             raise ValueError("HOSTIFY_API_KEY no está configurada en las variables de entorno")
@@ -130,48 +1190,187 @@ class HostifyAPI:
             "x-api-key": self.api_key,
             "Content-Type": "application/json"
         }
+        self.timeouts = {**self.DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.detail_cache = detail_cache
+        self.profiler = profiler or RunProfiler()
+        self.hedger = hedger
+        self.call_budget = call_budget or CallBudget()
+        # Índice de listings (id → ListingInfo) construido en get_all_listing_ids
+        self.listing_index: Dict[str, ListingInfo] = {}
+        # Mensajes ya enviados por hilo (build_inbox_index); send_chat_message no repite
+        self.inbox_index: Optional[InboxIndex] = None
+        
+        # Sesión compartida (pool de conexiones) y pool de hilos para paginación en paralelo
+        self.max_workers = max_workers
+        self.transport = transport or HttpTransport()
+        self.session = self.transport.session
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # per_page máximo detectado por endpoint
+        self._page_sizes: Dict[str, int] = {}
+    
+    def _request(self, method: str, endpoint: str, path: str, **kwargs) -> requests.Response:
+        """Llamada HTTP a Hostify con el timeout de su familia de endpoints"""
+        
+        def send():
+            self.call_budget.spend(endpoint)
+            return self.transport.request(
+                method,
+                f"{self.base_url}{path}",
+                headers=self.headers,
+                timeout=self.timeouts[endpoint],
+                **kwargs
+            )
+        
+        with self.profiler.stage("http"):
+            if self.hedger:
+                return self.hedger.call(endpoint, method, send)
+            return send()
+    
+    def _get_page(self, endpoint: str, path: str, items_key: str, params: Dict[str, Any],
+                  page: int, per_page: int) -> Dict[str, Any]:
+        """Obtiene una página de un endpoint paginado (normaliza respuestas tipo lista)"""
+        
+        response = self._request("GET", endpoint, path, params={**params, "page": page, "per_page": per_page})
+        response.raise_for_status()
+        with self.profiler.stage("json"):
+            data = response.json()
+        
+        if isinstance(data, list):
+            # Respuesta directa como lista
+            return {items_key: data}
+        return data if isinstance(data, dict) else {}
+    
+    def _detect_page_size(self, size_key: str, per_page: int, items: List[Any], total: Any) -> int:
+        """Si la página 1 trae menos items de los pedidos sin llegar al `total`, recuerda ese tamaño como el máximo"""
+        if isinstance(total, int) and 0 < len(items) < min(per_page, total):
+            per_page = len(items)
+            self._page_sizes[size_key] = per_page
+        return per_page
+    
+    def _iter_pages(self, endpoint: str, path: str, items_key: str, size_key: str,
+                    params: Optional[Dict[str, Any]] = None, max_pages: Optional[int] = None):
+        """
+        Itera las páginas de un endpoint paginado devolviendo (número de página, items) en orden.
+        
+        Pide la página 1 con el mayor per_page conocido para el endpoint (size_key) y, si
+        la API devuelve menos items que los pedidos sin llegar al `total`, recuerda ese
+        tamaño como el máximo aceptado. Con el `total`, calcula el número de páginas y
+        pide el resto en paralelo, en tandas de `max_workers` páginas: si quien itera deja
+        de consumir (break), no se piden más tandas. Sin `total`, pagina secuencialmente
+        mientras la API indique next_page o, si no lo da, hasta una página incompleta.
+        """
+        
+        params = dict(params or {})
+        per_page = self._page_sizes.get(size_key, self.MAX_PER_PAGE)
+        
+        first = self._get_page(endpoint, path, items_key, params, 1, per_page)
+        items = first.get(items_key) or []
+        total = first.get("total")
+        per_page = self._detect_page_size(size_key, per_page, items, total)
+        
+        yield 1, items
+        
+        if not items:
+            return
+        
+        if isinstance(total, int) and total > 0:
+            last_page = math.ceil(total / per_page)
+            if max_pages:
+                last_page = min(last_page, max_pages)
+            
+            pages = list(range(2, last_page + 1))
+            for start in range(0, len(pages), self.max_workers):
+                batch = pages[start:start + self.max_workers]
+                futures = {
+                    page: self._executor.submit(self._get_page, endpoint, path, items_key, params, page, per_page)
+                    for page in batch
+                }
+                for page in batch:
+                    try:
+                        page_items = futures[page].result().get(items_key) or []
+                    except CassetteMissError:
+                        for pending in futures.values():
+                            pending.cancel()
+                        raise
+                    except Exception as e:
+                        print(f"⚠️ Error en página {page} de {path}: {str(e)}")
+                        for pending in futures.values():
+                            pending.cancel()
+                        return
+                    yield page, page_items
+            return
+        
+        # Sin total: paginación secuencial. Con next_page se sigue mientras lo haya; sin él,
+        # hasta una página más corta que la pedida o que el tope conocido del endpoint
+        # (que puede ignorar per_page, p. ej. 20 en children)
+        page_size = min(per_page, self._page_sizes.get(size_key, self.DEFAULT_PAGE_CAPS.get(size_key, per_page)))
+        page, data = 1, first
+        while not max_pages or page < max_pages:
+            if "next_page" in data:
+                if not data["next_page"]:
+                    return
+            elif len(items) < page_size:
+                return
+            page += 1
+            data = self._get_page(endpoint, path, items_key, params, page, per_page)
+            items = data.get(items_key) or []
+            if not items:
+                return
+            yield page, items
+    
+    def build_inbox_index(self, max_pages: Optional[int] = 20) -> InboxIndex:
+        """
+        Construye el índice de mensajes salientes recientes con el listado paginado
+        de /inbox (hilos más recientes primero, hasta max_pages páginas) y lo deja en
+        self.inbox_index para que send_chat_message no repita mensajes.
+        """
+        
+        print("📬 Indexando mensajes recientes del inbox...")
+        index = InboxIndex()
+        threads = 0
+        
+        try:
+            for page, page_threads in self._iter_pages(
+                "inbox", "/inbox", "threads", "inbox", max_pages=max_pages
+            ):
+                for thread in page_threads:
+                    if isinstance(thread, dict):
+                        index.add_thread(thread)
+                        threads += 1
+        except Exception as e:
+            print(f"⚠️ Error indexando el inbox: {str(e)}")
+        
+        print(f"✅ {threads} hilos revisados, {len(index)} con mensajes enviados")
+        self.inbox_index = index
+        return index
     
     def get_child_listings(self, parent_id: int) -> List[Dict[str, Any]]:
         """Obtiene las propiedades child (Booking, Airbnb, Vrbo, etc.) para un parent_id específico"""
         
         all_child_listings = []
-        page = 1
         max_pages = 10  # Límite de seguridad
         
-        while page <= max_pages:
-            try:
-                params = {'page': page}
-                url_children = f"{self.base_url}/listings/children/{parent_id}"
-                
-                response = requests.get(url_children, headers=self.headers, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                if 'listings' not in data or not data['listings']:
-                    break
-                
-                page_children = data['listings']
+        try:
+            for page, page_children in self._iter_pages(
+                "listings", f"/listings/children/{parent_id}", "listings", "children", max_pages=max_pages
+            ):
                 all_child_listings.extend(page_children)
-                
-                # Si recibimos menos que una página completa, no hay más datos
-                if len(page_children) < 20:  # Tamaño típico de página
-                    break
-                    
-                page += 1
-                
-            except Exception as e:
-                print(f"⚠️ Error obteniendo children de {parent_id}, página {page}: {str(e)}")
-                break
+        except CassetteMissError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Error obteniendo children de {parent_id}: {str(e)}")
         
         return all_child_listings
 
-    def get_all_listing_ids(self) -> Dict[str, List[int]]:
+    def get_all_listing_ids(self) -> Dict[str, Any]:
         """
         Obtiene TODOS los IDs de listings: tanto PARENT como CHILDREN
         
         Returns:
-            Dict con keys 'parent_ids' y 'all_ids' (parent + children)
+            Dict con keys 'parent_ids', 'all_ids' (parent + children) y
+            'listings' (índice id → ListingInfo, también en self.listing_index)
         """
         
         print("🏠 Obteniendo todas las propiedades activas (PARENT)...")
@@ -191,6 +1390,8 @@ class HostifyAPI:
                 
             parent_ids.append(parent_id)
             all_listing_ids.append(parent_id)
+            parent_info = ListingInfo.from_parent(property_data)
+            self.listing_index[str(parent_id)] = parent_info
             
             print(f"  {i:2d}. 🏠 Parent: {property_name} (ID: {parent_id})")
             
@@ -203,34 +1404,27 @@ class HostifyAPI:
                     
                     for child in child_listings:
                         child_id = child.get('id')
-                        fs_type = child.get('fs_integration_type')
-                        is_listed = child.get('is_listed', 0)
                         
                         if child_id:
                             all_listing_ids.append(child_id)
+                            child_info = ListingInfo.from_child(child, parent_info)
+                            self.listing_index[str(child_id)] = child_info
                             
                             # Mostrar tipo de integración
-                            integration_name = "Desconocido"
-                            if fs_type == 22:
-                                integration_name = "Booking.com"
-                            elif fs_type == 26:
-                                integration_name = "Vrbo"
-                            elif fs_type == 1 and is_listed == 1:
-                                integration_name = "Airbnb"
-                            elif fs_type == 1:
-                                integration_name = "Airbnb (no listado)"
-                            
-                            print(f"         └─ Child: {child_id} ({integration_name})")
+                            print(f"         └─ Child: {child_id} ({child_info.integration_name})")
                 else:
                     print(f"      📋 Sin children")
                     
+            except CassetteMissError:
+                raise
             except Exception as e:
                 print(f"      ❌ Error obteniendo children de {parent_id}: {str(e)}")
                 continue
         
         result = {
             'parent_ids': parent_ids,
-            'all_ids': all_listing_ids
+            'all_ids': all_listing_ids,
+            'listings': dict(self.listing_index)
         }
         
         print(f"\n📊 RESUMEN DE IDs:")
@@ -245,181 +1439,198 @@ class HostifyAPI:
         
         print("🏠 Obteniendo propiedades activas (PARENT)...")
         all_properties = []
-        page = 1
         
-        while True:
-            try:
-                response = requests.get(
-                    f"{self.base_url}/listings", 
-                    headers=self.headers,
-                    params={"status": "active", "page": page}
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                if isinstance(data, dict):
-                    # Obtener propiedades de esta página
-                    page_properties = data.get("listings", [])
-                    if page_properties:
-                        all_properties.extend(page_properties)
-                        print(f"  📄 Página {page}: {len(page_properties)} propiedades")
-                    
-                    # Verificar si hay más páginas
-                    total = data.get("total", 0)
-                    next_page = data.get("next_page")
-                    
-                    if not next_page or len(all_properties) >= total:
-                        break
-                    
-                    page += 1
-                else:
-                    # Respuesta directa como lista
-                    all_properties = data if isinstance(data, list) else []
-                    break
-                    
-            except Exception as e:
-                print(f"⚠️ Error en página {page}: {str(e)}")
-                break
+        try:
+            for page, page_properties in self._iter_pages(
+                "listings", "/listings", "listings", "listings", params={"status": "active"}
+            ):
+                if page_properties:
+                    all_properties.extend(page_properties)
+                    print(f"  📄 Página {page}: {len(page_properties)} propiedades")
+        except CassetteMissError:
+            # En replay, una página no grabada no es "sin propiedades": la ejecución falla con error
+            raise
+        except Exception as e:
+            print(f"⚠️ Error obteniendo propiedades: {str(e)}")
         
         print(f"✅ {len(all_properties)} propiedades parent encontradas en total")
         return all_properties
     
-    def get_future_bookings_with_details(self, listing_id: str) -> List[Dict[str, Any]]:
-        """Obtiene reservas futuras con datos enriquecidos"""
+    def get_future_bookings_with_details(self, listing_id: str, checkin_from: Optional[DateLike] = None,
+                                         checkin_to: Optional[DateLike] = None,
+                                         skip: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[ReservationRecord]:
+        """
+        Obtiene reservas futuras con datos enriquecidos
         
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        Args:
+            listing_id: ID del listing
+            checkin_from: Check-in mínimo (por defecto hoy)
+            checkin_to: Check-in máximo (None = sin límite)
+            skip: Si devuelve True para una reserva del listado, se descarta sin enriquecer
+        """
+        
+        params, checkin_from, checkin_to = self._future_reservation_params(listing_id, checkin_from, checkin_to)
         
         print(f"📋 Obteniendo reservas ACEPTADAS futuras para listing {listing_id}...")
-        print(f"    🗓️ Filtro de fecha: check-in >= {today}")
+        print(f"    🗓️ Filtro de fecha: {checkin_from} <= check-in{f' <= {checkin_to}' if checkin_to else ''}")
         
         # Ya no necesitamos filters array, usamos query params directos
         all_reservations = []
-        page = 1
-        page_size = 50
-        has_more_data = True
+        # Se asume orden por check-in hasta que una página demuestre lo contrario
+        sorted_by_checkin = True
+        last_checkin = ""
         
-        while has_more_data:
-            try:
-                params = {
-                    "listing_id": int(listing_id),
-                    "page": page,
-                    "per_page": page_size,
-                    "status": "accepted",  # Filtrar directamente en query params
-                    "checkIn_gte": today   # Check-in mayor o igual a hoy
-                }
-                
-                response = requests.get(
-                    f"{self.base_url}/reservations",
-                    headers=self.headers,
-                    params=params
-                )
-                
-                response.raise_for_status()
-                reservations_response = response.json()
-                
-                page_reservations = reservations_response.get("reservations", [])
-                total_reservations = reservations_response.get("total", 0)
-                
+        try:
+            for page, page_reservations in self._iter_pages(
+                "reservations", "/reservations", "reservations", "reservations", params=params
+            ):
                 print(f"  📊 Página {page}: {len(page_reservations)} reservas recibidas de API")
                 
-                # Filtro adicional a nivel de código para asegurar solo "accepted" Y fechas futuras
-                today_date = datetime.datetime.now().date()
+                # Filtro adicional a nivel de código para asegurar solo "accepted" Y fechas dentro de la ventana.
+                # Las fechas ISO (YYYY-MM-DD) se comparan directamente como texto, sin strptime.
                 accepted_reservations = []
                 
                 for res in page_reservations:
                     reservation_id = res.get('id')
-                    checkin_str = res.get("checkIn", "")
+                    checkin_str = res.get("checkIn") or ""
                     status = res.get("status", "")
                     
+                    # Comprobar si la API respeta el orden pedido
+                    if checkin_str:
+                        if checkin_str < last_checkin:
+                            sorted_by_checkin = False
+                        last_checkin = checkin_str
+                    
                     # Verificar status
                     if status != "accepted":
                         continue
                     
-                    # Verificar fecha de check-in futura
-                    if checkin_str:
-                        try:
-                            checkin_date = datetime.datetime.strptime(checkin_str, "%Y-%m-%d").date()
-                            if checkin_date >= today_date:
-                                accepted_reservations.append(res)
-                                print(f"    ✅ Reserva {reservation_id} ACEPTADA: check-in={checkin_str}")
-                        except ValueError:
-                            continue
-                    else:
+                    # Verificar fecha de check-in dentro de la ventana
+                    if not is_iso_date(checkin_str):
                         continue
+                    if checkin_str < checkin_from or (checkin_to and checkin_str > checkin_to):
+                        continue
+                    
+                    if skip and skip(res):
+                        print(f"    📭 Reserva {reservation_id} ya tiene el mensaje en su hilo - sin enriquecer")
+                        continue
+                    
+                    accepted_reservations.append(res)
+                    print(f"    ✅ Reserva {reservation_id} ACEPTADA: check-in={checkin_str}")
                 
-                # Enriquecer datos de cada reserva aceptada (si las hay)
-                if accepted_reservations:
-                    for reservation in accepted_reservations:
-                        self._enrich_reservation_data(reservation)
-                    all_reservations.extend(accepted_reservations)
+                # Enriquecer cada reserva aceptada y quedarse solo con el registro compacto
+                for reservation in accepted_reservations:
+                    with self.profiler.stage("enrich"):
+                        all_reservations.append(self._enrich_reservation_data(reservation, int(listing_id)))
                 
                 print(f"  📄 Página {page}: {len(accepted_reservations)} reservas aceptadas de {len(page_reservations)} recibidas")
                 
-                # Verificar si hay más páginas BASADO EN LOS DATOS CRUDOS, no en los filtrados
-                if len(page_reservations) < page_size or len(page_reservations) == 0:
-                    # Si recibimos menos reservas que el tamaño de página, es la última página
-                    has_more_data = False
-                else:
-                    # Continuar a la siguiente página
-                    page += 1
+                if checkin_to and sorted_by_checkin and last_checkin > checkin_to:
+                    # Páginas ordenadas y ya pasamos el límite superior: el resto queda fuera de la ventana
+                    print(f"  ⏹️ Check-in {last_checkin} supera {checkin_to} - fin de paginación")
+                    break
                     
-            except Exception as e:
-                print(f"⚠️ Error en página {page}: {str(e)}")
-                has_more_data = False
+        except CassetteMissError:
+            # En replay una petición no grabada no es un listing vacío: el listing no se completa
+            raise
+        except Exception as e:
+            print(f"⚠️ Error obteniendo reservas del listing {listing_id}: {str(e)}")
         
         print(f"✅ {len(all_reservations)} reservas ACEPTADAS obtenidas")
         return all_reservations
     
-    def _enrich_reservation_data(self, reservation: Dict[str, Any]) -> None:
-        """Enriquece datos de reserva con información adicional"""
+    def _future_reservation_params(self, listing_id: str, checkin_from: Optional[DateLike] = None,
+                                   checkin_to: Optional[DateLike] = None) -> Tuple[Dict[str, Any], str, Optional[str]]:
+        """Query params de /reservations para reservas aceptadas en la ventana de check-in (desde hoy)"""
+        
+        today = self.transport.today().isoformat()
+        checkin_from = max(to_iso_date(checkin_from), today) if checkin_from else today
+        checkin_to = to_iso_date(checkin_to) if checkin_to else None
+        
+        params = {
+            "listing_id": int(listing_id),
+            "status": "accepted",  # Filtrar directamente en query params
+            "checkIn_gte": checkin_from,  # Check-in mayor o igual al inicio de la ventana
+            "sort_by": "checkIn",  # Orden ascendente para poder cortar la paginación
+            "sort_order": "asc"
+        }
+        if checkin_to:
+            params["checkIn_lte"] = checkin_to
+        return params, checkin_from, checkin_to
+    
+    def sample_future_reservations(self, listing_id: str, checkin_from: Optional[DateLike] = None,
+                                   checkin_to: Optional[DateLike] = None) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+        """
+        Una sola llamada (la página 1 que pediría el envío) para planificar: devuelve el
+        `total` que informa la API (None si no lo da) y las reservas de esa página.
+        Detecta de paso el per_page máximo del endpoint, como _iter_pages.
+        """
+        
+        params, _, _ = self._future_reservation_params(listing_id, checkin_from, checkin_to)
+        per_page = self._page_sizes.get("reservations", self.MAX_PER_PAGE)
+        data = self._get_page("reservations", "/reservations", "reservations", params, 1, per_page)
+        reservations = data.get("reservations") or []
+        total = data.get("total")
+        self._detect_page_size("reservations", per_page, reservations, total)
+        return (total if isinstance(total, int) else None), reservations
+    
+    def _enrich_reservation_data(self, reservation: Dict[str, Any], listing_id=None) -> ReservationRecord:
+        """Enriquece la reserva con su detalle y devuelve el registro compacto (descarta payloads)"""
         
         reservation_id = reservation.get("id")
+        listing_id = reservation.get("listing_id") or listing_id
+        
+        # Si el listado ya trae el nombre del huésped y el índice de listings tiene el
+        # nombre de la propiedad, el detalle no aporta nada: no se pide
+        listing_info = self.listing_index.get(str(listing_id))
+        if listing_info and listing_info.name and ReservationRecord._parse_guest_name(reservation, {}):
+            return ReservationRecord.from_api(reservation, listing_id=listing_id)
+        
+        # Detalle guardado en ejecuciones anteriores (si sigue vigente)
+        details = self.detail_cache.get(reservation) if self.detail_cache else None
+        if details is not None:
+            return ReservationRecord.from_api(reservation, details, listing_id=listing_id)
         
         try:
             # Obtener detalles completos
-            response = requests.get(
-                f"{self.base_url}/reservations/{reservation_id}",
-                headers=self.headers
-            )
+            response = self._request("GET", "detail", f"/reservations/{reservation_id}")
             
             if response.status_code == 200:
-                detailed_data = response.json()
-                
-                # Combinar datos adicionales
-                reservation.update({
-                    "detailed_guest_info": detailed_data.get("guest", {}),
-                    "property_details": detailed_data.get("listing", {}),
-                    "booking_details": detailed_data.get("booking_details", {}),
-                    "additional_info": detailed_data.get("additional_info", {})
-                })
+                with self.profiler.stage("json"):
+                    details = ReservationRecord.trim_details(response.json())
+                if self.detail_cache:
+                    self.detail_cache.put(reservation, details)
             
         except Exception as e:
             print(f"⚠️ No se pudieron enriquecer datos para reserva {reservation_id}")
+        
+        return ReservationRecord.from_api(reservation, details, listing_id=listing_id)
     
-    def send_chat_message(self, reservation_id: int, message: str, booking_data: Dict[str, Any]) -> Dict[str, Any]:
+    def send_chat_message(self, reservation_id: int, message: str, booking_data: ReservationRecord) -> Dict[str, Any]:
         """Envía mensaje al chat de la reserva"""
         
         try:
-            thread_id = booking_data.get("message_id") or booking_data.get("inbox_id")
+            thread_id = booking_data.message_id or booking_data.inbox_id
             
             if not thread_id:
                 return {"error": "No message_id or inbox_id found in booking data"}
             
+            # El hilo ya tiene este mismo mensaje (otra ejecución o progreso reiniciado)
+            if self.inbox_index and self.inbox_index.contains(thread_id, message):
+                return {"already_sent": True, "thread_id": thread_id}
+            
             payload = {
                 "thread_id": thread_id,
                 "message": message,
                 "send_by": "channel"
             }
             
-            response = requests.post(
-                f"{self.base_url}/inbox/reply",
-                headers=self.headers,
-                json=payload
-            )
+            response = self._request("POST", "inbox_reply", "/inbox/reply", json=payload)
             
             response.raise_for_status()
             result = response.json()
+            if self.inbox_index:
+                self.inbox_index.add(thread_id, message)
             
             return result
             
@@ -430,28 +1641,56 @@ class HostifyAPI:
 class MessageProcessor:
     """Procesador de mensajes con datos reales"""
     
-    def __init__(self):
-        self.hostify = HostifyAPI()
-        self.chekin = ChekinConnector()
+    def __init__(self, chekin_fail_fast: bool = False, hostify_timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+                 detail_cache: Optional[ReservationDetailCache] = None, profiler: Optional[RunProfiler] = None,
+                 transport: Optional[HttpTransport] = None, hostify_api_key: Optional[str] = None,
+                 chekin_api_key: Optional[str] = None, hedger: Optional[RequestHedger] = None,
+                 call_budget: Optional[CallBudget] = None):
+        self.profiler = profiler or RunProfiler()
+        self.transport = transport or HttpTransport()
+        self.hedger = hedger
+        self.call_budget = call_budget or CallBudget()
+        self.hostify = HostifyAPI(timeouts=hostify_timeouts, detail_cache=detail_cache, profiler=self.profiler,
+                                  transport=self.transport, api_key=hostify_api_key, hedger=hedger,
+                                  call_budget=self.call_budget)
+        self.chekin = ChekinConnector(fail_fast=chekin_fail_fast, transport=self.transport, api_key=chekin_api_key,
+                                      hedger=hedger, call_budget=self.call_budget)
+        # Links de Chekin ya consultados (se reutilizan entre campañas)
+        self._checkin_links: Dict[str, Optional[str]] = {}
         
         print(f"🔗 Chekin: {'✅ Disponible' if self.chekin.is_available else '❌ No disponible (usando fallbacks)'}")
     
-    def process_message(self, message_template: str, booking: Dict[str, Any]) -> Optional[str]:
-        """Procesa mensaje reemplazando variables con datos reales. Retorna None si no hay URL de Chekin"""
+    @staticmethod
+    def needs_chekin_link(message_template: str) -> bool:
+        """Indica si la plantilla lleva el enlace de Chekin (cada envío consulta Chekin)"""
+        return "{{chekin_signup_form_link}}" in message_template or "{{checkin_signup_form_link}}" in message_template
+    
+    def needs_chekin_call(self, message_template: str, booking: ReservationRecord) -> bool:
+        """Indica si renderizar la plantilla para la reserva consultará Chekin (enlace no memorizado)"""
+        return (self.needs_chekin_link(message_template) and self.chekin.is_available
+                and str(booking.id or "") not in self._checkin_links)
+    
+    def process_message(self, message_template: str, booking: ReservationRecord) -> Optional[str]:
+        """
+        Procesa mensaje reemplazando variables con datos reales. Retorna None si no hay URL de Chekin
+        
+        Raises:
+            ChekinUnavailableError: Chekin no responde; la reserva debe aplazarse
+        """
         
         processed_message = message_template
-        reservation_id = str(booking.get("id", ""))
+        reservation_id = str(booking.id or "")
         
         print(f"🔄 Procesando mensaje para reserva {reservation_id}")
         
         # Verificar si necesitamos URL de Chekin
-        needs_chekin_link = "{{chekin_signup_form_link}}" in message_template or "{{checkin_signup_form_link}}" in message_template
+        needs_chekin_link = self.needs_chekin_link(message_template)
         
         if needs_chekin_link:
             # Obtener URL de Chekin primero
             checkin_link = self._get_checkin_link(reservation_id, booking)
             if not checkin_link:
-                checkin_date = booking.get("checkIn", "N/A")
+                checkin_date = booking.checkin or "N/A"
                 print(f"  ❌ Reserva {reservation_id} (check-in: {checkin_date}) - Sin URL de Chekin disponible - mensaje NO enviado")
                 return None
         
@@ -475,12 +1714,13 @@ class MessageProcessor:
         
         # 3. Otras variables
         other_replacements = {
-            "{{checkin_date}}": booking.get("checkIn", "N/A"),
-            "{{checkout_date}}": booking.get("checkOut", "N/A"),
+            "{{checkin_date}}": booking.checkin or "N/A",
+            "{{checkout_date}}": booking.checkout or "N/A",
             "{{reservation_id}}": reservation_id,
-            "{{guests_count}}": str(booking.get("guests", "N/A")),
+            "{{guests_count}}": str(booking.guests if booking.guests is not None else "N/A"),
             "{{property_name}}": self._extract_property_name(booking),
-            "{{booking_source}}": booking.get("source", "N/A")
+            "{{booking_source}}": booking.source or "N/A",
+            "{{channel}}": self._extract_channel(booking)
         }
         
         for variable, value in other_replacements.items():
@@ -490,65 +1730,62 @@ class MessageProcessor:
         
         return processed_message
     
-    def _extract_guest_name(self, booking: Dict[str, Any]) -> str:
-        """Extrae nombre del huésped con múltiples fallbacks"""
-        
-        # Intentar diferentes campos
-        guest_name_fields = [
-            "guest_name",
-            "guestName", 
-            "guest",
-            "primary_guest",
-            "customer_name"
-        ]
-        
-        for field in guest_name_fields:
-            name = booking.get(field)
-            if name and isinstance(name, str) and name.strip():
-                return name.strip()
-        
-        # Buscar en datos detallados
-        detailed_guest = booking.get("detailed_guest_info", {})
-        if detailed_guest:
-            first_name = detailed_guest.get("first_name") or detailed_guest.get("name")
-            if first_name:
-                last_name = detailed_guest.get("last_name", "")
-                return f"{first_name} {last_name}".strip()
-        
-        return "Estimado huésped"
+    def _extract_guest_name(self, booking: ReservationRecord) -> str:
+        """Nombre del huésped (resuelto con fallbacks al construir el registro)"""
+        return booking.guest_name or "Estimado huésped"
     
     def _get_checkin_link(self, reservation_id: str, booking: Dict[str, Any]) -> Optional[str]:
-        """Obtiene link de check-in SOLO de Chekin - retorna None si no está disponible"""
+        """Obtiene link de check-in SOLO de Chekin - retorna None si no está disponible (propaga ChekinUnavailableError)"""
+        
+        if reservation_id in self._checkin_links:
+            return self._checkin_links[reservation_id]
         
         # Solo intentar Chekin - no usar fallbacks
+        checkin_link = None
         if self.chekin.is_available:
-            chekin_link = self.chekin.get_checkin_link(reservation_id)
+            with self.profiler.stage("chekin"):
+                chekin_link = self.chekin.get_checkin_link(reservation_id)
             if chekin_link and chekin_link.startswith("http"):
-                return chekin_link
+                checkin_link = chekin_link
 
-        # No hay fallback - retornar None si no se encuentra en Chekin
-        return None
+        # No hay fallback - se guarda None si no se encuentra en Chekin
+        self._checkin_links[reservation_id] = checkin_link
+        return checkin_link
     
-    def _extract_property_name(self, booking: Dict[str, Any]) -> str:
-        """Extrae nombre de la propiedad"""
-        
-        property_details = booking.get("property_details", {})
+    def _extract_property_name(self, booking: ReservationRecord) -> str:
+        """Extrae nombre de la propiedad (índice de listings primero, sin llamadas HTTP)"""
         
-        name_fields = ["name", "title", "property_name", "listing_name"]
-        
-        for field in name_fields:
-            name = booking.get(field) or property_details.get(field)
-            if name and isinstance(name, str) and name.strip():
-                return name.strip()
+        listing_info = self.hostify.listing_index.get(str(booking.listing_id))
+        if listing_info and listing_info.name:
+            return listing_info.name
+        return booking.property_name or "Su alojamiento"
+    
+    def _extract_channel(self, booking: ReservationRecord) -> str:
+        """Canal del listing según el índice (o el source de la reserva)"""
         
-        return "Su alojamiento"
+        listing_info = self.hostify.listing_index.get(str(booking.listing_id))
+        if listing_info and listing_info.channel:
+            return listing_info.channel
+        return booking.source or "N/A"
 
 class ProgressTracker:
-    """Controlador de progreso para evitar procesar propiedades ya completadas"""
+    """
+    Controlador de progreso para evitar procesar propiedades ya completadas.
     
-    def __init__(self, progress_file: str = "broadcast_progress.json"):
+    Cada envío se añade a un log (una línea por reserva) en vez de reescribir el
+    JSON completo; el log se integra en el JSON al completar una propiedad.
+    """
+    
+    def __init__(self, progress_file: str = "broadcast_progress.json", profiler: Optional[RunProfiler] = None):
         self.progress_file = progress_file
+        self.sent_log_file = os.path.splitext(progress_file)[0] + ".sent.log"
+        self.profiler = profiler or RunProfiler()
+        # Reservas aplazadas por caída de Chekin: {listing_id: [reservation_id, ...]}
+        self.deferred_reservations: Dict[str, List[str]] = {}
+        # Reservas ya enviadas de propiedades aún no completadas: {listing_id: [reservation_id, ...]}
+        self.sent_reservations: Dict[str, List[str]] = {}
         self.completed_properties = self._load_progress()
+        self._load_sent_log()
         self.current_session = {
             "start_time": datetime.datetime.now().isoformat(),
             "properties_processed": 0,
@@ -563,24 +1800,46 @@ class ProgressTracker:
                 with open(self.progress_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     completed = set(data.get("completed_properties", []))
+                    self.deferred_reservations = data.get("deferred_reservations", {})
+                    self.sent_reservations = data.get("sent_reservations", {})
                     print(f"📋 Progreso cargado: {len(completed)} propiedades ya procesadas")
+                    if self.deferred_reservations:
+                        deferred_count = sum(len(ids) for ids in self.deferred_reservations.values())
+                        print(f"📋 {deferred_count} reservas aplazadas pendientes de reintento")
                     return completed
         except Exception as e:
             print(f"⚠️ Error cargando progreso: {e}")
         
         return set()
     
+    def _load_sent_log(self):
+        """Añade a sent_reservations los envíos registrados después del último guardado"""
+        try:
+            if os.path.exists(self.sent_log_file):
+                with open(self.sent_log_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        property_id, _, reservation_id = line.strip().partition("\t")
+                        if reservation_id and not self.is_reservation_sent(property_id, reservation_id):
+                            self.sent_reservations.setdefault(property_id, []).append(reservation_id)
+        except Exception as e:
+            print(f"⚠️ Error cargando envíos del log de progreso: {e}")
+    
     def _save_progress(self):
         """Guarda el progreso actual"""
         try:
             progress_data = {
                 "completed_properties": list(self.completed_properties),
+                "deferred_reservations": self.deferred_reservations,
+                "sent_reservations": self.sent_reservations,
                 "last_update": datetime.datetime.now().isoformat(),
                 "session_summary": self.current_session
             }
             
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
+            with self.profiler.stage("save_progress"), open(self.progress_file, 'w', encoding='utf-8') as f:
                 json.dump(progress_data, f, indent=2, ensure_ascii=False)
+            # El JSON ya incluye los envíos del log
+            if os.path.exists(self.sent_log_file):
+                os.remove(self.sent_log_file)
                 
         except Exception as e:
             print(f"⚠️ Error guardando progreso: {e}")
@@ -589,9 +1848,32 @@ class ProgressTracker:
         """Verifica si una propiedad ya fue procesada"""
         return str(property_id) in self.completed_properties
     
-    def mark_property_completed(self, property_id: str, messages_sent: int):
-        """Marca una propiedad como completada"""
+    def get_deferred(self, property_id: str) -> set:
+        """Reservas aplazadas de una propiedad (a reintentar)"""
+        return set(self.deferred_reservations.get(str(property_id), []))
+    
+    def is_reservation_sent(self, property_id: str, reservation_id: str) -> bool:
+        """Verifica si ya se envió a una reserva de una propiedad a medio procesar"""
+        return str(reservation_id) in self.sent_reservations.get(str(property_id), [])
+    
+    def mark_reservation_sent(self, property_id: str, reservation_id: str):
+        """Registra un envío antes de completar la propiedad (evita reenvíos si la ejecución se corta)"""
+        self.sent_reservations.setdefault(str(property_id), []).append(str(reservation_id))
+        # Una línea al final del log: coste constante por envío, sin reescribir el JSON
+        try:
+            with self.profiler.stage("save_progress"), open(self.sent_log_file, 'a', encoding='utf-8') as f:
+                f.write(f"{property_id}\t{reservation_id}\n")
+        except Exception as e:
+            print(f"⚠️ Error guardando progreso: {e}")
+    
+    def mark_property_completed(self, property_id: str, messages_sent: int, deferred: Optional[List[str]] = None):
+        """Marca una propiedad como completada, guardando las reservas que quedaron aplazadas"""
         self.completed_properties.add(str(property_id))
+        self.sent_reservations.pop(str(property_id), None)
+        if deferred:
+            self.deferred_reservations[str(property_id)] = sorted(str(d) for d in deferred)
+        else:
+            self.deferred_reservations.pop(str(property_id), None)
         self.current_session["properties_processed"] += 1
         self.current_session["messages_sent"] += messages_sent
         self._save_progress()
@@ -615,39 +1897,127 @@ class ProgressTracker:
             if os.path.exists(self.progress_file):
                 os.remove(self.progress_file)
                 print("🗑️ Progreso reiniciado")
+            if os.path.exists(self.sent_log_file):
+                os.remove(self.sent_log_file)
             self.completed_properties = set()
+            self.deferred_reservations = {}
+            self.sent_reservations = {}
         except Exception as e:
             print(f"⚠️ Error reiniciando progreso: {e}")
 
-def broadcast_message_to_specific_listing(listing_id: str, message_template: str) -> Dict[str, Any]:
+class ListingActivityStats:
+    """
+    Estadísticas por listing entre ejecuciones para no paginar /reservations en
+    listings que nunca tienen reservas (p. ej. children de canal no publicados).
+    
+    Por listing se guarda cuántas veces se consultó, cuántas tuvo reservas
+    futuras, la última fecha con reservas y las consultas vacías seguidas. Un
+    listing con dormant_after_runs consultas vacías seguidas queda "dormido" y solo
+    se sondea cada probe_every_runs ejecuciones o cada probe_every_days días; en
+    cuanto aparece una reserva vuelve a consultarse siempre.
+    """
+    
+    def __init__(self, path: str = "listing_stats.json", dormant_after_runs: int = 5,
+                 probe_every_runs: int = 10, probe_every_days: float = 7):
+        self.path = path
+        self.dormant_after_runs = dormant_after_runs
+        self.probe_every_runs = probe_every_runs
+        self.probe_every_days = probe_every_days
+        self.run = 0
+        self.listings: Dict[str, Dict[str, Any]] = {}
+        self._load()
+    
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    self.run = data.get("runs", 0)
+                    self.listings = data.get("listings", {})
+        except Exception as e:
+            print(f"⚠️ Error cargando estadísticas de listings: {e}")
+    
+    def save(self):
+        """Guarda las estadísticas"""
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({"runs": self.run, "listings": self.listings}, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️ Error guardando estadísticas de listings: {e}")
+    
+    def start_run(self):
+        """Cuenta una ejecución nueva (para el sondeo cada N ejecuciones)"""
+        self.run += 1
+    
+    def is_dormant(self, listing_id: str) -> bool:
+        stats = self.listings.get(str(listing_id))
+        return bool(stats) and stats["consecutive_empty"] >= self.dormant_after_runs
+    
+    def should_scan(self, listing_id: str) -> bool:
+        """Indica si hay que consultar las reservas del listing en esta ejecución"""
+        
+        if not self.is_dormant(listing_id):
+            return True
+        
+        stats = self.listings[str(listing_id)]
+        if self.run - stats["last_scan_run"] >= self.probe_every_runs:
+            return True
+        last_scan = datetime.datetime.fromisoformat(stats["last_scan_at"])
+        return datetime.datetime.now() - last_scan >= datetime.timedelta(days=self.probe_every_days)
+    
+    def record_scan(self, listing_id: str, bookings_found: int):
+        """Registra el resultado de consultar el listing (sin filtro de fechas)"""
+        
+        stats = self.listings.setdefault(str(listing_id), {
+            "scans": 0, "non_empty": 0, "consecutive_empty": 0, "last_non_empty": None
+        })
+        now = datetime.datetime.now()
+        stats["scans"] += 1
+        stats["last_scan_run"] = self.run
+        stats["last_scan_at"] = now.isoformat()
+        if bookings_found:
+            stats["non_empty"] += 1
+            stats["consecutive_empty"] = 0
+            stats["last_non_empty"] = now.date().isoformat()
+        else:
+            stats["consecutive_empty"] += 1
+
+def broadcast_message_to_specific_listing(listing_id: str, message_template: str,
+                                          profiler: Optional[RunProfiler] = None,
+                                          transport: Optional[HttpTransport] = None) -> Dict[str, Any]:
     """Envía mensajes a un listing específico usando datos reales - TODAS las reservas"""
     
-    processor = MessageProcessor()
+    profiler = profiler or RunProfiler()
+    profiler.start()
+    processor = MessageProcessor(profiler=profiler, transport=transport)
     
     results = {
         "listing_id": listing_id,
         "total_bookings": 0,
         "messages_sent": 0,
+        "deferred": [],
         "errors": [],
         "chekin_available": processor.chekin.is_available
     }
     
     try:
         # Obtener reservas futuras
-        future_bookings = processor.hostify.get_future_bookings_with_details(listing_id)
+        with profiler.stage("fetch"):
+            future_bookings = processor.hostify.get_future_bookings_with_details(listing_id)
         results["total_bookings"] = len(future_bookings)
         
         print(f"\n📨 Procesando TODAS las {len(future_bookings)} reservas futuras")
         
         for i, booking in enumerate(future_bookings, 1):
-            booking_id = booking["id"]
+            booking_id = booking.id
             guest_name = processor._extract_guest_name(booking)
             
             print(f"📧 {i}/{len(future_bookings)}: Procesando reserva #{booking_id} ({guest_name})")
             
             try:
                 # Procesar mensaje con datos reales
-                final_message = processor.process_message(message_template, booking)
+                with profiler.stage("render"):
+                    final_message = processor.process_message(message_template, booking)
                 
                 # Si no hay URL de Chekin, saltear esta reserva
                 if final_message is None:
@@ -655,7 +2025,8 @@ def broadcast_message_to_specific_listing(listing_id: str, message_template: str
                     continue
                 
                 # Enviar mensaje
-                result = processor.hostify.send_chat_message(booking_id, final_message, booking)
+                with profiler.stage("send"):
+                    result = processor.hostify.send_chat_message(booking_id, final_message, booking)
                 
                 if "error" not in result:
                     results["messages_sent"] += 1
@@ -664,6 +2035,10 @@ def broadcast_message_to_specific_listing(listing_id: str, message_template: str
                     error_msg = f"Error en reserva {booking_id}: {result.get('error')}"
                     results["errors"].append(error_msg)
                     print(f"   ⚠️ {error_msg}")
+            
+            except ChekinUnavailableError as e:
+                results["deferred"].append(str(booking_id))
+                print(f"   ⏸️ Reserva {booking_id} aplazada - Chekin no disponible: {str(e)}")
                     
             except Exception as e:
                 error_msg = f"Error procesando reserva {booking_id}: {str(e)}"
@@ -673,6 +2048,7 @@ def broadcast_message_to_specific_listing(listing_id: str, message_template: str
         print(f"\n📊 RESUMEN LISTING {listing_id}:")
         print(f"   📋 Reservas encontradas: {results['total_bookings']}")
         print(f"   ✅ Mensajes enviados: {results['messages_sent']}")
+        print(f"   ⏸️ Aplazadas (Chekin no disponible): {len(results['deferred'])}")
         print(f"   ❌ Errores: {len(results['errors'])}")
         
         return results
@@ -682,16 +2058,309 @@ def broadcast_message_to_specific_listing(listing_id: str, message_template: str
         results["errors"].append(error_msg)
         print(f"❌ {error_msg}")
         return results
+    
+    finally:
+        if profiler.enabled:
+            profiler.stop()
+            profiler.print_report()
+            results["profile"] = profiler.report()
+
+class RunDeadline:
+    """Límite de tiempo global de una ejecución (None = sin límite)"""
+    
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+    
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes (None si no hay límite)"""
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - (time.monotonic() - self.started_at))
+    
+    def expired(self, fraction: float = 1.0) -> bool:
+        """Indica si se agotó el tiempo de la ejecución (o la fracción indicada de él)"""
+        return self.seconds is not None and time.monotonic() - self.started_at >= self.seconds * fraction
+
+class RateLimiter:
+    """Limita el ritmo de llamadas (máximo N por minuto, None = sin límite)"""
+    
+    def __init__(self, max_per_minute: Optional[float] = None):
+        self.max_per_minute = max_per_minute
+        self.min_interval = 60.0 / max_per_minute if max_per_minute else 0.0
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """Espera hasta que se pueda hacer la siguiente llamada"""
+        
+        if not self.min_interval:
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_allowed - now
+            self._next_allowed = max(now, self._next_allowed) + self.min_interval
+        
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def priority_by_checkin(booking: ReservationRecord, campaign: "Campaign") -> Any:
+    """Prioridad por defecto: check-in más próximo primero"""
+    return booking.checkin or "9999-12-31"
+
+class SendScheduler:
+    """
+    Cola de prioridad (heapq) de envíos pendientes de todas las campañas y listings.
+    
+    Los envíos salen por orden de priority_key(booking, campaign), de menor a mayor
+    (por defecto el check-in), así que ante un límite de ritmo o de tiempo los más
+    urgentes se envían primero. A igual prioridad se respeta el orden de llegada.
+    """
+    
+    def __init__(self, priority_key: Optional[Callable[[ReservationRecord, "Campaign"], Any]] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.priority_key = priority_key or priority_by_checkin
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._heap = []
+        self._counter = itertools.count()
+    
+    def push(self, booking: ReservationRecord, campaign: "Campaign", listing_id: str):
+        """Encola un envío (listing_id: listing en el que se encontró la reserva)"""
+        entry = (self.priority_key(booking, campaign), next(self._counter), booking, campaign, listing_id)
+        heapq.heappush(self._heap, entry)
+    
+    def peek(self) -> Tuple[ReservationRecord, "Campaign", str]:
+        """Devuelve el envío más prioritario sin sacarlo de la cola"""
+        _, _, booking, campaign, listing_id = self._heap[0]
+        return booking, campaign, listing_id
+    
+    def pop(self, wait: bool = True) -> Tuple[ReservationRecord, "Campaign", str]:
+        """Saca el envío más prioritario, respetando el límite de ritmo (wait=False: sin esperar, no se envía)"""
+        _, _, booking, campaign, listing_id = heapq.heappop(self._heap)
+        if wait:
+            self.rate_limiter.wait()
+        return booking, campaign, listing_id
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+
+class Campaign:
+    """Campaña de mensajes: plantilla + criterios de segmentación de reservas"""
+    
+    def __init__(self, name: str, message_template: str,
+                 checkin_from_days: Optional[int] = None,
+                 checkin_to_days: Optional[int] = None,
+                 sources: Optional[List[str]] = None,
+                 channels: Optional[List[str]] = None,
+                 listing_ids: Optional[List[int]] = None,
+                 predicate: Optional[Callable[[ReservationRecord], bool]] = None,
+                 progress_file: Optional[str] = None):
+        """
+        Args:
+            name: Nombre único de la campaña (se usa en el archivo de progreso)
+            message_template: Plantilla con variables {{...}}
+            checkin_from_days: Check-in a partir de hoy + N días (None = sin límite)
+            checkin_to_days: Check-in hasta hoy + N días (None = sin límite)
+            sources: Canales de reserva admitidos (ej. ["airbnb", "booking.com"])
+            channels: Canales de listing admitidos según el índice (ej. ["Airbnb", "Directo"])
+            listing_ids: Listings admitidos (None = todos)
+            predicate: Filtro adicional que recibe la reserva y devuelve bool
+            progress_file: Archivo de progreso propio de la campaña
+        """
+        self.name = name
+        self.message_template = message_template
+        self.checkin_from_days = checkin_from_days
+        self.checkin_to_days = checkin_to_days
+        self.sources = {s.lower() for s in sources} if sources else None
+        self.channels = {c.lower() for c in channels} if channels else None
+        self.listing_ids = {str(l) for l in listing_ids} if listing_ids else None
+        self.predicate = predicate
+        self.progress_file = progress_file or f"broadcast_progress_{re.sub(r'[^A-Za-z0-9_-]+', '_', name)}.json"
+    
+    def checkin_bounds(self, today: Optional[datetime.date] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Ventana de check-in de la campaña como fechas ISO (None = sin límite)"""
+        
+        today = today or datetime.datetime.now().date()
+        checkin_from = None
+        checkin_to = None
+        
+        if self.checkin_from_days is not None:
+            checkin_from = (today + datetime.timedelta(days=self.checkin_from_days)).isoformat()
+        if self.checkin_to_days is not None:
+            checkin_to = (today + datetime.timedelta(days=self.checkin_to_days)).isoformat()
+        
+        return checkin_from, checkin_to
+    
+    def targets_listing(self, listing_id) -> bool:
+        """Indica si la campaña puede afectar a un listing"""
+        return self.listing_ids is None or str(listing_id) in self.listing_ids
+    
+    def matches(self, booking: ReservationRecord, listing_id, listing_info: Optional[ListingInfo] = None,
+                today: Optional[datetime.date] = None) -> bool:
+        """Verifica si una reserva cumple los criterios de la campaña (today: fecha de referencia)"""
+        
+        if not self.targets_listing(listing_id):
+            return False
+        
+        if self.sources is not None:
+            source = str(booking.source or "").lower()
+            if source not in self.sources:
+                return False
+        
+        if self.channels is not None:
+            channel = listing_info.channel if listing_info else booking.source
+            if str(channel or "").lower() not in self.channels:
+                return False
+        
+        if self.checkin_from_days is not None or self.checkin_to_days is not None:
+            checkin_str = booking.checkin or ""
+            if not is_iso_date(checkin_str):
+                return False
+            
+            # Comparación directa de fechas ISO como texto
+            checkin_from, checkin_to = self.checkin_bounds(today)
+            if checkin_from and checkin_str < checkin_from:
+                return False
+            if checkin_to and checkin_str > checkin_to:
+                return False
+        
+        if self.predicate is not None and not self.predicate(booking):
+            return False
+        
+        return True
+
+def campaigns_checkin_window(campaigns: List[Campaign],
+                             today: Optional[datetime.date] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Ventana de check-in que cubre todas las campañas (unión de sus ventanas)"""
+    
+    bounds = [campaign.checkin_bounds(today) for campaign in campaigns]
+    froms = [checkin_from for checkin_from, _ in bounds]
+    tos = [checkin_to for _, checkin_to in bounds]
+    
+    # Si alguna campaña no tiene límite, la ventana común tampoco
+    checkin_from = None if None in froms else min(froms)
+    checkin_to = None if None in tos else max(tos)
+    return checkin_from, checkin_to
 
-def broadcast_message_to_all_future_bookings(message_template: str, restart_progress: bool = False, listing_data: Dict[str, List[int]] = None) -> Dict[str, Any]:
-    """Envía mensajes a TODAS las reservas futuras (PARENT + CHILDREN) con control de progreso paso a paso"""
+def broadcast_campaigns(campaigns: List[Campaign], restart_progress: bool = False, listing_data: Dict[str, Any] = None,
+                        chekin_fail_fast: bool = False, deadline_seconds: Optional[float] = None,
+                        hostify_timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+                        detail_cache_path: Optional[str] = "reservation_cache.sqlite3",
+                        detail_cache_ttl: float = 3 * 24 * 3600,
+                        priority_key: Optional[Callable[[ReservationRecord, Campaign], Any]] = None,
+                        send_rate_per_minute: Optional[float] = None,
+                        listing_pause_seconds: float = 2.0,
+                        collect_deadline_fraction: float = 0.5,
+                        profiler: Optional[RunProfiler] = None,
+                        transport: Optional[HttpTransport] = None,
+                        account: Optional[str] = None,
+                        hostify_api_key: Optional[str] = None,
+                        chekin_api_key: Optional[str] = None,
+                        listing_stats_path: Optional[str] = "listing_stats.json",
+                        force_full_scan: bool = False,
+                        hedge_requests: bool = False,
+                        hedge_max_extra_load: float = 0.05,
+                        call_budget: Optional[Dict[str, int]] = None,
+                        skip_already_messaged: bool = False,
+                        inbox_max_pages: Optional[int] = 20) -> Dict[str, Any]:
+    """
+    Envía varias campañas en una sola pasada (PARENT + CHILDREN).
+    
+    Cada reserva se obtiene y enriquece UNA sola vez y se envía a todas las
+    campañas cuyos criterios cumple. El progreso se guarda por campaña.
+    
+    Primero se recopilan las reservas de todos los listings y después los envíos
+    salen de una cola de prioridad común (SendScheduler): por defecto el check-in
+    más próximo primero, o según priority_key(booking, campaign). Con
+    send_rate_per_minute se limita el ritmo de envío. Un listing se marca
+    completado cuando salen todos sus envíos; los ya enviados de un listing a
+    medias se recuerdan para no repetirlos.
+    
+    Si Chekin cae durante la ejecución, las reservas afectadas quedan como
+    aplazadas en el progreso y se reintentan en la siguiente ejecución.
+    Con chekin_fail_fast=True, en cuanto el circuito se abre se aplazan todas
+    las reservas restantes sin volver a probar Chekin.
+    
+    Con deadline_seconds, la recopilación deja de consultar listings nuevos al
+    pasar collect_deadline_fraction del tiempo (por defecto la mitad), para que
+    quede tiempo de enviar lo recopilado por prioridad. Al agotarse el tiempo no
+    se hacen más envíos (siempre se hace al menos uno, para que cada ejecución
+    avance): el envío en curso termina, el progreso queda guardado y la
+    siguiente ejecución continúa donde se quedó. hostify_timeouts ajusta los
+    timeouts por familia de endpoints (ver HostifyAPI.DEFAULT_TIMEOUTS).
+    
+    Los detalles de reserva se guardan en detail_cache_path (SQLite) durante
+    detail_cache_ttl segundos; None desactiva la caché. En grabación y replay
+    no se usa caché y se empieza siempre sin progreso ni estadísticas de listings.
+    
+    Con un RunProfiler activo, el desglose por etapa se muestra al final y se
+    guarda en results["profile"] y en el resumen de sesión del progreso.
+    
+    Con un RecordingTransport o ReplayTransport no se envía ningún mensaje y el
+    progreso va a archivos aparte (broadcast_progress_<campaña>.<modo>.json), para
+    que los envíos simulados no cuenten como hechos en una ejecución real.
+    
+    Con account (ver broadcast_accounts) se usan las API keys indicadas y el
+    progreso y la caché de detalles llevan el nombre de la cuenta.
+    
+    Los listings que nunca tienen reservas (ListingActivityStats en
+    listing_stats_path) solo se consultan de vez en cuando; force_full_scan=True
+    los consulta todos en esta ejecución. None desactiva las estadísticas.
+    
+    Con hedge_requests, los GETs (Hostify y Chekin) que tardan más del p95 de su
+    endpoint se duplican, como mucho en hedge_max_extra_load de las peticiones.
+    
+    call_budget fija un máximo duro de llamadas por endpoint (listings,
+    reservations, detail, inbox_reply, chekin). Al agotarse, la ejecución para
+    como con deadline_seconds: el listing a medias no se da por consultado y el
+    progreso queda guardado. plan_broadcast estima las llamadas de antemano.
+    
+    Con skip_already_messaged se indexan los mensajes recientes del inbox
+    (inbox_max_pages páginas de /inbox) y no se envía a hilos que ya tienen el
+    mensaje: si el hilo tiene un mensaje de la plantilla de todas las campañas
+    pendientes, la reserva ni se enriquece ni se consulta en Chekin; si no, se
+    comprueba la plantilla antes de Chekin y el mensaje exacto antes de enviar.
+    """
     
-    processor = MessageProcessor()
-    progress = ProgressTracker()
+    if not campaigns:
+        raise ValueError("Se necesita al menos una campaña")
+    
+    names = [campaign.name for campaign in campaigns]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Nombres de campaña duplicados: {names}")
+    
+    profiler = profiler or RunProfiler()
+    profiler.start()
+    deadline = RunDeadline(deadline_seconds)
+    # Grabación/replay sin caché de detalles, sin progreso previo y sin saltar listings
+    # sin reservas: el cassette recoge todo el trabajo, cada replay repite las mismas
+    # consultas y la caché real no se lee ni se escribe
+    if transport is not None and transport.blocks_sends:
+        detail_cache_path = None
+        listing_stats_path = None
+        restart_progress = True
+    detail_cache = (ReservationDetailCache(tagged_path(detail_cache_path, account), detail_cache_ttl)
+                    if detail_cache_path else None)
+    hedger = RequestHedger(max_extra_load=hedge_max_extra_load) if hedge_requests else None
+    budget = CallBudget(call_budget)
+    processor = MessageProcessor(chekin_fail_fast=chekin_fail_fast, hostify_timeouts=hostify_timeouts,
+                                 detail_cache=detail_cache, profiler=profiler, transport=transport,
+                                 hostify_api_key=hostify_api_key, chekin_api_key=chekin_api_key, hedger=hedger,
+                                 call_budget=budget)
+    mode = processor.transport.mode if processor.transport.blocks_sends else None
+    # Referencia de las ventanas de check-in (en replay, la fecha de la grabación)
+    today = processor.transport.today()
+    listing_stats = ListingActivityStats(tagged_path(listing_stats_path, account, mode)) if listing_stats_path else None
+    trackers = {
+        campaign.name: ProgressTracker(tagged_path(campaign.progress_file, account, mode), profiler)
+        for campaign in campaigns
+    }
     
     # Opción para reiniciar progreso
     if restart_progress:
-        progress.reset_progress()
+        for tracker in trackers.values():
+            tracker.reset_progress()
     
     results = {
         "total_parent_properties": 0,
@@ -700,21 +2369,65 @@ def broadcast_message_to_all_future_bookings(message_template: str, restart_prog
         "properties_skipped": 0,
         "total_bookings": 0,
         "messages_sent": 0,
+        "deferred_bookings": 0,
+        "deadline_reached": False,
+        "budget_exhausted": False,
+        "already_messaged": 0,
+        "listings_pending": 0,
+        "listings_dormant_skipped": 0,
         "errors": [],
         "chekin_available": processor.chekin.is_available,
-        "progress_file": progress.progress_file
+        "campaigns": {
+            campaign.name: {
+                "matched_bookings": 0,
+                "messages_sent": 0,
+                "skipped_no_chekin": 0,
+                "already_messaged": 0,
+                "deferred": [],
+                "errors": [],
+                "progress_file": trackers[campaign.name].progress_file
+            }
+            for campaign in campaigns
+        }
     }
     
+    def record_error(campaign_name: Optional[str], error_msg: str):
+        results["errors"].append(error_msg)
+        targets = [campaign_name] if campaign_name else list(trackers)
+        for name in targets:
+            if campaign_name:
+                results["campaigns"][name]["errors"].append(error_msg)
+            trackers[name].add_error(error_msg)
+    
     try:
         # 1. OBTENER TODOS LOS IDs (PARENT + CHILDREN) - SOLO SI NO SE PASARON
         if listing_data is None:
             print("🔄 Paso 1: Obteniendo TODOS los IDs de listings (Parent + Children)...")
-            listing_data = processor.hostify.get_all_listing_ids()
+            with profiler.stage("discovery"):
+                listing_data = processor.hostify.get_all_listing_ids()
         else:
             print("🔄 Paso 1: Usando IDs previamente obtenidos...")
         
+        # Sin presupuesto para descubrir todos los listings: no se procesa una lista incompleta
+        if budget.exhausted:
+            results["budget_exhausted"] = True
+            print(f"🧮 Presupuesto de llamadas a {budget.exhausted_endpoint} agotado durante el descubrimiento de listings")
+            return results
+        
+        # Mensajes ya enviados por hilo (evita repetir tras reiniciar el progreso o en ejecuciones solapadas)
+        inbox_index = None
+        if skip_already_messaged:
+            with profiler.stage("discovery"):
+                inbox_index = processor.hostify.build_inbox_index(inbox_max_pages)
+            if budget.exhausted:
+                results["budget_exhausted"] = True
+                print(f"🧮 Presupuesto de llamadas a {budget.exhausted_endpoint} agotado indexando el inbox")
+                return results
+        
         parent_ids = listing_data['parent_ids']
         all_listing_ids = listing_data['all_ids']
+        # Índice de listings del descubrimiento (nombres y canales sin llamadas extra)
+        processor.hostify.listing_index.update(listing_data.get('listings', {}))
         
         results["total_parent_properties"] = len(parent_ids)
         results["total_listing_ids"] = len(all_listing_ids)
@@ -724,13 +2437,57 @@ def broadcast_message_to_all_future_bookings(message_template: str, restart_prog
             return results
         
         print(f"✅ Sistema expandido: {len(parent_ids)} propiedades parent → {len(all_listing_ids)} IDs totales")
+        print(f"📣 Campañas: {', '.join(names)}")
         
         # Mostrar resumen de progreso previo
-        if progress.completed_properties:
-            print(f"📋 Progreso anterior: {len(progress.completed_properties)} IDs ya completados")
+        for name, tracker in trackers.items():
+            if tracker.completed_properties:
+                print(f"📋 Progreso anterior [{name}]: {len(tracker.completed_properties)} IDs ya completados")
+        
+        # 2. RECOPILAR LOS ENVÍOS DE CADA LISTING (PARENT + CHILDREN)
+        scheduler = SendScheduler(priority_key, RateLimiter(send_rate_per_minute))
+        # Envíos en cola por (campaña, listing): al llegar a 0 el listing se marca completado
+        queued_sends: Dict[Tuple[str, str], int] = {}
+        listing_messages_sent: Dict[Tuple[str, str], int] = {}
+        listing_deferred: Dict[Tuple[str, str], List[str]] = {}
+        # Campañas que aún no han terminado cada listing
+        open_campaigns: Dict[str, set] = {}
+        
+        def record_already_messaged(campaign_name: str, listing_key: Optional[str] = None, booking_id=None):
+            # El huésped ya tiene el mensaje: cuenta como enviado para el progreso, no como envío nuevo
+            if listing_key is not None:
+                trackers[campaign_name].mark_reservation_sent(listing_key, booking_id)
+            results["campaigns"][campaign_name]["already_messaged"] += 1
+            results["already_messaged"] += 1
+        
+        def complete_listing(campaign_name: str, listing_key: str):
+            key = (campaign_name, listing_key)
+            trackers[campaign_name].mark_property_completed(
+                listing_key, listing_messages_sent.pop(key, 0), deferred=listing_deferred.pop(key, [])
+            )
+            open_campaigns[listing_key].discard(campaign_name)
+            if not open_campaigns[listing_key]:
+                results["properties_processed"] += 1
         
-        # 2. PROCESAR CADA LISTING ID PASO A PASO (PARENT + CHILDREN)
+        if listing_stats:
+            listing_stats.start_run()
+        
+        uncollected_listings = 0
         for i, listing_id in enumerate(all_listing_ids, 1):
+            listing_key = str(listing_id)
+            
+            # Sin tiempo para recopilar: no se empiezan listings nuevos y el resto se
+            # reserva para enviar lo ya recopilado (el progreso ya está guardado).
+            # Para que cada ejecución avance se sigue hasta tener algún envío en cola,
+            # o al menos un listing consultado si ya se agotó todo el tiempo
+            if (deadline.expired(collect_deadline_fraction)
+                    and (scheduler or (open_campaigns and deadline.expired()))):
+                results["deadline_reached"] = True
+                uncollected_listings = len(all_listing_ids) - i + 1
+                print(f"\n⏰ Tiempo de recopilación agotado ({collect_deadline_fraction:.0%} de {deadline_seconds}s) - "
+                      f"{uncollected_listings} listings sin consultar")
+                break
+            
             # Determinar si es parent o child
             is_parent = listing_id in parent_ids
             listing_type = "PARENT" if is_parent else "CHILD"
@@ -739,82 +2496,225 @@ def broadcast_message_to_all_future_bookings(message_template: str, restart_prog
             print(f"🏠 LISTING {i}/{len(all_listing_ids)}: ID {listing_id} ({listing_type})")
             print(f"{'='*60}")
             
-            # Verificar si ya fue procesado
-            if progress.is_property_completed(str(listing_id)):
-                print(f"⏭️ Listing ya completado anteriormente - SALTANDO")
+            # Campañas que aún tienen trabajo pendiente en este listing.
+            # En listings ya completados solo se reintentan las reservas aplazadas.
+            retry_only = {}
+            for campaign in campaigns:
+                if not campaign.targets_listing(listing_id):
+                    continue
+                tracker = trackers[campaign.name]
+                if not tracker.is_property_completed(listing_key):
+                    retry_only[campaign.name] = None
+                elif tracker.get_deferred(listing_key):
+                    retry_only[campaign.name] = tracker.get_deferred(listing_key)
+            pending_campaigns = [campaign for campaign in campaigns if campaign.name in retry_only]
+            
+            if not pending_campaigns:
+                print(f"⏭️ Listing ya completado (o fuera de campaña) - SALTANDO")
                 results["properties_skipped"] += 1
                 continue
             
+            # Listing sin reservas en las últimas consultas: solo se sondea de vez en cuando.
+            # No se marca completado, para que un sondeo posterior lo procese.
+            if listing_stats and not force_full_scan and not listing_stats.should_scan(listing_key):
+                print(f"💤 Listing sin reservas en las últimas consultas - SALTANDO hasta el próximo sondeo")
+                results["listings_dormant_skipped"] += 1
+                continue
+            
             try:
-                # 3. OBTENER RESERVAS DE ESTE LISTING
+                # 3. OBTENER RESERVAS DE ESTE LISTING (una sola vez para todas las campañas)
                 print(f"📋 Paso 2: Obteniendo reservas futuras del listing {listing_id}...")
-                future_bookings = processor.hostify.get_future_bookings_with_details(str(listing_id))
+                checkin_from, checkin_to = campaigns_checkin_window(pending_campaigns, today)
+                # Reservas descartadas por estar ya en el inbox (siguen contando como reservas del listing)
+                messaged_reservations = []
                 
-                if not future_bookings:
-                    print(f"ℹ️ No hay reservas futuras - marcando como completado")
-                    progress.mark_property_completed(str(listing_id), 0)
-                    results["properties_processed"] += 1
-                    continue
+                def already_messaged(reservation: Dict[str, Any]) -> bool:
+                    # Todas las campañas pendientes ya están en el hilo: ni detalle ni Chekin
+                    thread_id = reservation.get("message_id") or reservation.get("inbox_id")
+                    if not thread_id or not all(inbox_index.matches_template(thread_id, campaign.message_template)
+                                                for campaign in pending_campaigns):
+                        return False
+                    # Solo cuenta para las campañas cuyos criterios cumple la reserva
+                    booking = ReservationRecord.from_api(reservation, listing_id=listing_id)
+                    listing_info = processor.hostify.listing_index.get(listing_key)
+                    for campaign in pending_campaigns:
+                        if campaign.matches(booking, listing_id, listing_info, today):
+                            record_already_messaged(campaign.name)
+                    messaged_reservations.append(reservation.get("id"))
+                    return True
                 
-                print(f"✅ {len(future_bookings)} reservas futuras encontradas")
-                results["total_bookings"] += len(future_bookings)
+                with profiler.stage("fetch"):
+                    future_bookings = processor.hostify.get_future_bookings_with_details(
+                        listing_key, checkin_from=checkin_from, checkin_to=checkin_to,
+                        skip=already_messaged if inbox_index else None
+                    )
                 
-                # 4. ENVIAR MENSAJES PARA TODAS LAS RESERVAS DE ESTE LISTING
-                print(f"📨 Paso 3: Enviando mensajes a TODAS las {len(future_bookings)} reservas...")
-                listing_messages_sent = 0
+                # Presupuesto agotado a mitad del listing: sus reservas pueden estar incompletas,
+                # se descarta y se consulta entero en la siguiente ejecución
+                if budget.exhausted:
+                    results["budget_exhausted"] = True
+                    uncollected_listings = len(all_listing_ids) - i + 1
+                    print(f"\n🧮 Presupuesto de llamadas a {budget.exhausted_endpoint} agotado - "
+                          f"{uncollected_listings} listings sin consultar")
+                    break
                 
-                for j, booking in enumerate(future_bookings, 1):
-                    booking_id = booking["id"]
-                    guest_name = processor._extract_guest_name(booking)
-                    
-                    print(f"   📧 {j}/{len(future_bookings)}: Procesando reserva #{booking_id} ({guest_name})")
+                # Solo cuenta como "vacío" si se consultaron todas las fechas futuras y no
+                # había reservas, tampoco ya mensajeadas
+                if listing_stats and checkin_from is None and checkin_to is None:
+                    listing_stats.record_scan(listing_key, len(future_bookings) + len(messaged_reservations))
+                
+                open_campaigns[listing_key] = {campaign.name for campaign in pending_campaigns}
+                listing_info = processor.hostify.listing_index.get(listing_key)
+                results["total_bookings"] += len(future_bookings)
+                
+                # 4. ENCOLAR LOS ENVÍOS DE CADA CAMPAÑA QUE APLIQUE A CADA RESERVA
+                for campaign in pending_campaigns:
+                    key = (campaign.name, listing_key)
+                    queued_sends[key] = 0
+                    retry_ids = retry_only[campaign.name]
                     
-                    try:
-                        # Procesar mensaje con datos reales
-                        final_message = processor.process_message(message_template, booking)
-                        
-                        # Si no hay URL de Chekin, saltear esta reserva
-                        if final_message is None:
-                            print(f"      ⚠️ Sin URL de Chekin - saltando")
+                    for booking in future_bookings:
+                        if retry_ids is not None and str(booking.id) not in retry_ids:
+                            continue
+                        if not campaign.matches(booking, listing_id, listing_info, today):
+                            continue
+                        # Enviada en una ejecución anterior que se cortó antes de completar el listing
+                        if trackers[campaign.name].is_reservation_sent(listing_key, booking.id):
                             continue
                         
-                        # Enviar mensaje
-                        result = processor.hostify.send_chat_message(booking_id, final_message, booking)
-                        
-                        if "error" not in result:
-                            listing_messages_sent += 1
-                            results["messages_sent"] += 1
-                            print(f"      ✅ Mensaje enviado exitosamente")
-                        else:
-                            error_msg = f"Error en reserva {booking_id}: {result.get('error')}"
-                            results["errors"].append(error_msg)
-                            progress.add_error(error_msg)
-                            print(f"      ⚠️ Error: {result.get('error')}")
-                            
-                    except Exception as e:
-                        error_msg = f"Error procesando reserva {booking_id}: {str(e)}"
-                        results["errors"].append(error_msg)
-                        progress.add_error(error_msg)
-                        print(f"      ❌ Error: {str(e)}")
-                
-                # 5. MARCAR LISTING COMO COMPLETADO
-                progress.mark_property_completed(str(listing_id), listing_messages_sent)
-                results["properties_processed"] += 1
+                        results["campaigns"][campaign.name]["matched_bookings"] += 1
+                        scheduler.push(booking, campaign, listing_key)
+                        queued_sends[key] += 1
+                    
+                    if queued_sends[key] == 0:
+                        complete_listing(campaign.name, listing_key)
                 
-                print(f"✅ Listing completado: {listing_messages_sent} mensajes enviados de {len(future_bookings)} reservas")
+                if future_bookings:
+                    print(f"✅ {len(future_bookings)} reservas futuras encontradas - {len(scheduler)} envíos en cola")
+                else:
+                    print(f"ℹ️ No hay reservas futuras - marcando como completado")
                 
                 # Pequeña pausa para no sobrecargar APIs
-                if i < len(all_listing_ids):  # No pausar en el último listing
-                    print(f"⏳ Pausa de 2 segundos antes del siguiente listing...")
-                    time.sleep(2)
+                if (future_bookings and listing_pause_seconds and i < len(all_listing_ids)
+                        and not deadline.expired(collect_deadline_fraction)):
+                    print(f"⏳ Pausa de {listing_pause_seconds} segundos antes del siguiente listing...")
+                    time.sleep(listing_pause_seconds)
                         
             except Exception as e:
                 error_msg = f"Error general en listing {listing_id}: {str(e)}"
-                results["errors"].append(error_msg)
-                progress.add_error(error_msg)
+                record_error(None, error_msg)
                 print(f"❌ {error_msg}")
                 continue  # Continuar con el siguiente listing
         
+        if listing_stats:
+            listing_stats.save()
+            if results["listings_dormant_skipped"]:
+                print(f"\n💤 {results['listings_dormant_skipped']} listings sin reservas saltados (forzar con force_full_scan)")
+        
+        # 5. ENVIAR POR PRIORIDAD (check-in más próximo primero) ENTRE TODOS LOS LISTINGS
+        total_queued = len(scheduler)
+        print(f"\n📨 Paso 3: Enviando {total_queued} mensajes por orden de prioridad...")
+        
+        sent_count = 0
+        chekin_budget_pending = 0
+        while scheduler:
+            # Al menos un envío por ejecución aunque la recopilación agotara el tiempo
+            if deadline.expired() and sent_count > 0:
+                results["deadline_reached"] = True
+                print(f"\n⏰ Límite de tiempo alcanzado ({deadline_seconds}s) - {len(scheduler)} envíos quedan para la próxima ejecución")
+                break
+            
+            # Cada envío hace un /inbox/reply
+            if not budget.allows("inbox_reply"):
+                results["budget_exhausted"] = True
+                print(f"\n🧮 Presupuesto de llamadas agotado - {len(scheduler)} envíos quedan para la próxima ejecución")
+                break
+            
+            # Sin presupuesto de Chekin solo esperan los envíos que lo consultarían (plantilla con
+            # el enlace y enlace aún no obtenido): el listing sigue abierto y la reserva se envía
+            # en la siguiente ejecución
+            booking, campaign, listing_key = scheduler.peek()
+            if processor.needs_chekin_call(campaign.message_template, booking) and not budget.allows("chekin"):
+                scheduler.pop(wait=False)
+                results["budget_exhausted"] = True
+                chekin_budget_pending += 1
+                continue
+            
+            booking, campaign, listing_key = scheduler.pop()
+            budget_stop = False
+            sent_count += 1
+            booking_id = booking.id
+            key = (campaign.name, listing_key)
+            campaign_results = results["campaigns"][campaign.name]
+            guest_name = processor._extract_guest_name(booking)
+            
+            print(f"   📧 {sent_count}/{total_queued}: [{campaign.name}] Reserva #{booking_id} ({guest_name}) - check-in {booking.checkin}")
+            
+            try:
+                # El hilo ya tiene un mensaje de esta plantilla: no hace falta Chekin ni renderizar
+                thread_id = booking.message_id or booking.inbox_id
+                if inbox_index and thread_id and inbox_index.matches_template(thread_id, campaign.message_template):
+                    record_already_messaged(campaign.name, listing_key, booking_id)
+                    print(f"      📭 [{campaign.name}] El hilo ya tiene este mensaje - saltando")
+                    continue
+                
+                # Procesar mensaje con datos reales
+                with profiler.stage("render"):
+                    final_message = processor.process_message(campaign.message_template, booking)
+                
+                # Si no hay URL de Chekin, saltear esta reserva
+                if final_message is None:
+                    campaign_results["skipped_no_chekin"] += 1
+                    print(f"      ⚠️ [{campaign.name}] Sin URL de Chekin - saltando")
+                    continue
+                
+                # Enviar mensaje
+                with profiler.stage("send"):
+                    result = processor.hostify.send_chat_message(booking_id, final_message, booking)
+                
+                if result.get("already_sent"):
+                    record_already_messaged(campaign.name, listing_key, booking_id)
+                    print(f"      📭 [{campaign.name}] El hilo ya tiene este mensaje - saltando")
+                elif "error" not in result:
+                    trackers[campaign.name].mark_reservation_sent(listing_key, booking_id)
+                    listing_messages_sent[key] = listing_messages_sent.get(key, 0) + 1
+                    campaign_results["messages_sent"] += 1
+                    results["messages_sent"] += 1
+                    print(f"      ✅ [{campaign.name}] Mensaje enviado exitosamente")
+                else:
+                    record_error(campaign.name, f"[{campaign.name}] Error en reserva {booking_id}: {result.get('error')}")
+                    print(f"      ⚠️ [{campaign.name}] Error: {result.get('error')}")
+            
+            except ChekinUnavailableError as e:
+                # Chekin caído: no se descarta, se aplaza para la siguiente ejecución
+                listing_deferred.setdefault(key, []).append(str(booking_id))
+                campaign_results["deferred"].append(str(booking_id))
+                results["deferred_bookings"] += 1
+                print(f"      ⏸️ [{campaign.name}] Aplazada (Chekin no disponible): {str(e)}")
+            
+            except CallBudgetExceeded as e:
+                # No se envió: el listing queda abierto y la reserva se envía en la siguiente ejecución
+                results["budget_exhausted"] = budget_stop = True
+                print(f"\n🧮 {str(e)} - {len(scheduler) + 1} envíos quedan para la próxima ejecución")
+                break
+                    
+            except Exception as e:
+                record_error(campaign.name, f"[{campaign.name}] Error procesando reserva {booking_id}: {str(e)}")
+                print(f"      ❌ [{campaign.name}] Error: {str(e)}")
+            
+            finally:
+                # Último envío de la campaña en este listing: marcar como completado
+                if not budget_stop:
+                    queued_sends[key] -= 1
+                    if queued_sends[key] == 0:
+                        complete_listing(campaign.name, listing_key)
+        
+        if chekin_budget_pending:
+            print(f"\n🧮 Presupuesto de llamadas a chekin agotado - {chekin_budget_pending} envíos con enlace de Chekin "
+                  f"quedan para la próxima ejecución")
+        
+        results["listings_pending"] = uncollected_listings + sum(1 for names in open_campaigns.values() if names)
+        
         # RESUMEN FINAL
         print(f"\n{'='*60}")
         print(f"🎯 RESUMEN FINAL")
@@ -823,18 +2723,325 @@ def broadcast_message_to_all_future_bookings(message_template: str, restart_prog
         print(f"🔗 Total listings procesados (Parent + Children): {results['total_listing_ids']}")
         print(f"✅ Listings completados: {results['properties_processed']}")
         print(f"⏭️ Listings saltados (ya completados): {results['properties_skipped']}")
+        if results["listings_dormant_skipped"]:
+            print(f"💤 Listings sin reservas no consultados: {results['listings_dormant_skipped']}")
+        if results["deadline_reached"]:
+            print(f"⏰ Listings pendientes por límite de tiempo: {results['listings_pending']}")
+        if results["budget_exhausted"]:
+            print(f"🧮 Listings pendientes por presupuesto de llamadas: {results['listings_pending']}")
+        for name, campaign_results in results["campaigns"].items():
+            print(f"📣 [{name}] Reservas objetivo: {campaign_results['matched_bookings']} | "
+                  f"Enviados: {campaign_results['messages_sent']} | "
+                  f"Sin Chekin: {campaign_results['skipped_no_chekin']} | "
+                  f"Ya en inbox: {campaign_results['already_messaged']} | "
+                  f"Aplazadas: {len(campaign_results['deferred'])} | "
+                  f"Errores: {len(campaign_results['errors'])} | "
+                  f"Progreso: {campaign_results['progress_file']}")
         print(f"📨 Total de mensajes enviados: {results['messages_sent']}")
+        if inbox_index:
+            print(f"📭 Envíos evitados (el hilo ya tenía el mensaje): {results['already_messaged']}")
+        print(f"⏸️ Reservas aplazadas (Chekin no disponible): {results['deferred_bookings']}")
+        if detail_cache:
+            results["detail_cache"] = detail_cache.get_stats()
+            print(f"🗄️ Caché de detalles: {results['detail_cache']['hits']} aciertos / {results['detail_cache']['misses']} fallos")
+        if hedger:
+            results["hedging"] = hedger.get_stats()
+            print(f"🪃 Peticiones duplicadas: {results['hedging']['hedged']}/{results['hedging']['requests']} "
+                  f"({results['hedging']['hedge_wins']} ganaron a la original)")
         print(f"❌ Errores: {len(results['errors'])}")
-        print(f"📋 Archivo de progreso: {progress.progress_file}")
         
         return results
         
     except Exception as e:
         error_msg = f"Error crítico: {str(e)}"
-        results["errors"].append(error_msg)
-        progress.add_error(error_msg)
+        record_error(None, error_msg)
         print(f"❌ {error_msg}")
         return results
+    
+    finally:
+        results["api_calls"] = dict(budget.calls)
+        if profiler.enabled:
+            profiler.stop()
+            profiler.print_report()
+            results["profile"] = profiler.report()
+            for tracker in trackers.values():
+                tracker.current_session["profile"] = results["profile"]
+                tracker._save_progress()
+
+def broadcast_message_to_all_future_bookings(message_template: str, restart_progress: bool = False, listing_data: Dict[str, Any] = None,
+                                             **options) -> Dict[str, Any]:
+    """
+    Envía mensajes a TODAS las reservas futuras (PARENT + CHILDREN) con control de progreso paso a paso
+    
+    Las opciones adicionales (chekin_fail_fast, deadline_seconds, ...) son las de broadcast_campaigns.
+    """
+    
+    # Una única campaña sin segmentación, con el archivo de progreso histórico
+    campaign = Campaign("default", message_template, progress_file="broadcast_progress.json")
+    results = broadcast_campaigns([campaign], restart_progress=restart_progress, listing_data=listing_data, **options)
+    results["progress_file"] = results["campaigns"][campaign.name]["progress_file"]
+    return results
+
+def plan_broadcast(campaigns: List[Campaign], restart_progress: bool = False, listing_data: Dict[str, Any] = None,
+                   detail_cache_path: Optional[str] = "reservation_cache.sqlite3",
+                   detail_cache_ttl: float = 3 * 24 * 3600,
+                   send_rate_per_minute: Optional[float] = None,
+                   listing_pause_seconds: float = 2.0,
+                   listing_stats_path: Optional[str] = "listing_stats.json",
+                   force_full_scan: bool = False,
+                   call_budget: Optional[Dict[str, int]] = None,
+                   transport: Optional[HttpTransport] = None,
+                   account: Optional[str] = None,
+                   hostify_api_key: Optional[str] = None,
+                   chekin_api_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pasada de planificación: estima las llamadas por endpoint y la duración de
+    broadcast_campaigns con las mismas opciones, sin enviar nada.
+    
+    Usa la topología de listings (descubrimiento real), una llamada por listing a
+    /reservations (la página 1 real, que detecta el per_page máximo) para leer el
+    `total`, el progreso guardado, las estadísticas de listings sin reservas y las
+    entradas vigentes de la caché de detalles. Chekin solo se cuenta para las
+    campañas cuya plantilla lleva el enlace. Las reservas y envíos son cotas superiores: el `total` puede incluir
+    reservas que luego se filtran y se supone que todas cumplen cada campaña.
+    """
+    
+    budget = CallBudget()
+    # Grabación/replay sin caché de detalles, sin progreso previo y sin saltar listings
+    # sin reservas: el cassette recoge todo el trabajo, cada replay repite las mismas
+    # consultas y la caché real no se lee ni se escribe
+    if transport is not None and transport.blocks_sends:
+        detail_cache_path = None
+        listing_stats_path = None
+        restart_progress = True
+    detail_cache = (ReservationDetailCache(tagged_path(detail_cache_path, account), detail_cache_ttl)
+                    if detail_cache_path else None)
+    processor = MessageProcessor(detail_cache=detail_cache, transport=transport, hostify_api_key=hostify_api_key,
+                                 chekin_api_key=chekin_api_key, call_budget=budget)
+    mode = processor.transport.mode if processor.transport.blocks_sends else None
+    # Referencia de las ventanas de check-in (en replay, la fecha de la grabación)
+    today = processor.transport.today()
+    listing_stats = ListingActivityStats(tagged_path(listing_stats_path, account, mode)) if listing_stats_path else None
+    trackers = {campaign.name: ProgressTracker(tagged_path(campaign.progress_file, account, mode))
+                for campaign in campaigns}
+    
+    print("🧮 PLANIFICACIÓN (sin envíos)")
+    if listing_data is None:
+        listing_data = processor.hostify.get_all_listing_ids()
+    processor.hostify.listing_index.update(listing_data.get('listings', {}))
+    all_listing_ids = listing_data['all_ids']
+    
+    plan = {
+        "listings_to_scan": 0,
+        "listings_completed": 0,
+        "listings_dormant_skipped": 0,
+        "listings_with_bookings": 0,
+        "estimated_bookings": 0,
+        "estimated_sends": 0,
+        "calls": {"listings": 0, "reservations": 0, "detail": 0, "chekin": 0, "inbox_reply": 0},
+        "errors": []
+    }
+    detail_candidates = 0
+    chekin_candidates = 0
+    latencies = []
+    
+    for listing_id in all_listing_ids:
+        listing_key = str(listing_id)
+        pending_campaigns = [
+            campaign for campaign in campaigns
+            if campaign.targets_listing(listing_id) and (
+                restart_progress
+                or not trackers[campaign.name].is_property_completed(listing_key)
+                or trackers[campaign.name].get_deferred(listing_key)
+            )
+        ]
+        if not pending_campaigns:
+            plan["listings_completed"] += 1
+            continue
+        if listing_stats and not force_full_scan and not listing_stats.should_scan(listing_key):
+            plan["listings_dormant_skipped"] += 1
+            continue
+        
+        checkin_from, checkin_to = campaigns_checkin_window(pending_campaigns, today)
+        started = time.perf_counter()
+        try:
+            total, sample = processor.hostify.sample_future_reservations(listing_key, checkin_from, checkin_to)
+        except Exception as e:
+            plan["errors"].append(f"Listing {listing_id}: {str(e)}")
+            continue
+        latencies.append(time.perf_counter() - started)
+        
+        bookings = total if total is not None else len(sample)
+        plan["listings_to_scan"] += 1
+        # Tamaño de página real (detectado en la propia consulta si el endpoint lo limita)
+        per_page = processor.hostify._page_sizes.get("reservations", HostifyAPI.MAX_PER_PAGE)
+        plan["calls"]["reservations"] += max(1, math.ceil(bookings / per_page))
+        if not bookings:
+            continue
+        
+        plan["listings_with_bookings"] += 1
+        plan["estimated_bookings"] += bookings
+        plan["estimated_sends"] += bookings * len(pending_campaigns)
+        # Chekin se consulta una vez por reserva (memo) y solo si alguna plantilla lleva el enlace
+        if any(MessageProcessor.needs_chekin_link(campaign.message_template) for campaign in pending_campaigns):
+            chekin_candidates += bookings
+        # Sin detalle si el listado trae el huésped y el índice el nombre del listing
+        listing_info = processor.hostify.listing_index.get(listing_key)
+        if not (listing_info and listing_info.name and sample and ReservationRecord._parse_guest_name(sample[0], {})):
+            detail_candidates += bookings
+    
+    cache_hit_rate = 0.0
+    if detail_cache and detail_candidates:
+        cache_hit_rate = min(1.0, detail_cache.fresh_entries() / detail_candidates)
+    plan["cache_hit_rate"] = cache_hit_rate
+    plan["calls"]["listings"] = budget.calls.get("listings", 0)
+    plan["calls"]["detail"] = round(detail_candidates * (1 - cache_hit_rate))
+    plan["calls"]["chekin"] = chekin_candidates if processor.chekin.is_available else 0
+    plan["calls"]["inbox_reply"] = plan["estimated_sends"]
+    plan["planning_calls"] = dict(budget.calls)
+    
+    # Duración: latencia media medida en /reservations aplicada a todas las llamadas (en serie)
+    latency = sum(latencies) / len(latencies) if latencies else 0.0
+    calls = plan["calls"]
+    send_seconds = plan["estimated_sends"] * latency + calls["chekin"] * latency
+    if send_rate_per_minute:
+        send_seconds = max(send_seconds, plan["estimated_sends"] * 60.0 / send_rate_per_minute)
+    plan["latency_seconds"] = latency
+    plan["estimated_seconds"] = (
+        (calls["listings"] + calls["reservations"] + calls["detail"]) * latency
+        + plan["listings_with_bookings"] * listing_pause_seconds
+        + send_seconds
+    )
+    plan["over_budget"] = {
+        endpoint: {"estimated": calls.get(endpoint, 0), "limit": limit}
+        for endpoint, limit in (call_budget or {}).items() if calls.get(endpoint, 0) > limit
+    }
+    
+    print(f"\n{'='*60}")
+    print(f"🧮 PLAN DE EJECUCIÓN{f' [{account}]' if account else ''}")
+    print(f"{'='*60}")
+    print(f"🔗 Listings a consultar: {plan['listings_to_scan']} "
+          f"(completados: {plan['listings_completed']}, sin reservas: {plan['listings_dormant_skipped']})")
+    print(f"📋 Reservas estimadas: ≤ {plan['estimated_bookings']} | Envíos estimados: ≤ {plan['estimated_sends']}")
+    print(f"🗄️ Aciertos de caché estimados: {cache_hit_rate:.0%}")
+    for endpoint, count in calls.items():
+        limit = (call_budget or {}).get(endpoint)
+        budget_note = f" / presupuesto {limit}" + (" ⚠️ EXCEDE" if count > limit else "") if limit is not None else ""
+        print(f"   {endpoint:<12} {count:>6} llamadas{budget_note}")
+    print(f"⏱️ Duración estimada: {plan['estimated_seconds'] / 60:.1f} min "
+          f"(latencia media {latency * 1000:.0f} ms{f', {send_rate_per_minute} envíos/min' if send_rate_per_minute else ''})")
+    
+    return plan
+
+class Account:
+    """Cuenta de Hostify (y su Chekin) para ejecuciones multi-cuenta"""
+    
+    def __init__(self, name: str, hostify_api_key: str, chekin_api_key: Optional[str] = None,
+                 transport: Optional[HttpTransport] = None, **options):
+        """
+        Args:
+            name: Nombre corto de la cuenta (se usa en archivos de progreso y caché)
+            hostify_api_key: API key de Hostify de la cuenta
+            chekin_api_key: API key de Chekin (None = CHEKIN_API_KEY del entorno)
+            transport: Transporte HTTP propio (grabación/replay) de la cuenta
+            options: Opciones de broadcast_campaigns solo para esta cuenta
+                (send_rate_per_minute, deadline_seconds, ...)
+        """
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name or ""):
+            raise ValueError(f"Nombre de cuenta no válido: {name!r} (solo letras, números, _ y -)")
+        if not hostify_api_key:
+            raise ValueError(f"La cuenta {name} no tiene API key de Hostify")
+        
+        self.name = name
+        self.hostify_api_key = hostify_api_key
+        self.chekin_api_key = chekin_api_key
+        self.transport = transport
+        self.options = options
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Account":
+        """
+        Crea la cuenta desde un dict (p. ej. de un JSON). Las keys pueden venir
+        directamente o por nombre de variable de entorno:
+        
+            {"name": "madrid", "hostify_api_key_env": "HOSTIFY_API_KEY_MADRID",
+             "chekin_api_key_env": "CHEKIN_API_KEY_MADRID", "send_rate_per_minute": 30}
+        """
+        
+        config = dict(config)
+        for field in ("hostify_api_key", "chekin_api_key"):
+            env_name = config.pop(f"{field}_env", None)
+            if env_name and not config.get(field):
+                config[field] = os.getenv(env_name)
+        return cls(**config)
+
+def broadcast_accounts(accounts: List[Account], campaigns: List[Campaign], max_concurrent_requests: int = 8,
+                       **options) -> Dict[str, Any]:
+    """
+    Envía las campañas en varias cuentas de Hostify a la vez (un hilo por cuenta).
+    
+    Cada cuenta usa sus propias API keys, sesión HTTP (pool de conexiones),
+    limitador de envío, progreso (broadcast_progress_<campaña>.<cuenta>.json) y
+    caché de detalles (reservation_cache.<cuenta>.sqlite3). Las peticiones de
+    todas las cuentas comparten max_concurrent_requests huecos que se reparten por
+    turnos (AccountScheduler).
+    
+    Las opciones se pasan a broadcast_campaigns; las de cada Account tienen
+    prioridad. Con un profiler activo, cada cuenta se perfila por separado (sin
+    memoria ni cProfile, que son de todo el proceso).
+    """
+    
+    if not accounts:
+        raise ValueError("Se necesita al menos una cuenta")
+    
+    names = [account.name for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Nombres de cuenta duplicados: {names}")
+    
+    scheduler = AccountScheduler(max_concurrent_requests)
+    profiler = options.pop("profiler", None)
+    
+    def run_account(account: Account) -> Dict[str, Any]:
+        account_options = {**options, **account.options}
+        if profiler and profiler.enabled:
+            account_options["profiler"] = RunProfiler(enabled=True)
+        transport = ScheduledTransport(account.transport or HttpTransport(), scheduler, account.name)
+        try:
+            return broadcast_campaigns(campaigns, account=account.name, hostify_api_key=account.hostify_api_key,
+                                       chekin_api_key=account.chekin_api_key, transport=transport,
+                                       **account_options)
+        except Exception as e:
+            print(f"❌ [{account.name}] Error crítico: {str(e)}")
+            return {"messages_sent": 0, "total_bookings": 0, "deferred_bookings": 0,
+                    "errors": [f"Error crítico: {str(e)}"]}
+    
+    print(f"👥 Procesando {len(accounts)} cuentas a la vez ({max_concurrent_requests} peticiones en paralelo)")
+    with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+        account_results = dict(zip(names, executor.map(run_account, accounts)))
+    
+    totals = {
+        field: sum(result.get(field, 0) for result in account_results.values())
+        for field in ("properties_processed", "total_bookings", "messages_sent", "deferred_bookings")
+    }
+    totals["errors"] = sum(len(result.get("errors", [])) for result in account_results.values())
+    
+    print(f"\n{'='*60}")
+    print(f"👥 RESUMEN POR CUENTA")
+    print(f"{'='*60}")
+    for name, result in account_results.items():
+        print(f"🏢 [{name}] Reservas: {result.get('total_bookings', 0)} | "
+              f"Enviados: {result.get('messages_sent', 0)} | "
+              f"Aplazadas: {result.get('deferred_bookings', 0)} | "
+              f"Errores: {len(result.get('errors', []))} | "
+              f"Peticiones: {scheduler.granted.get(name, 0)}")
+    print(f"📨 TOTAL: {totals['messages_sent']} mensajes enviados en {len(accounts)} cuentas "
+          f"({totals['total_bookings']} reservas, {totals['errors']} errores)")
+    
+    return {
+        "accounts": account_results,
+        "total": totals,
+        "requests_per_account": dict(scheduler.granted)
+    }
 
 def load_message_from_file(file_path: str) -> str:
     """Carga mensaje desde archivo"""
@@ -854,10 +3061,11 @@ def load_message_from_file(file_path: str) -> str:
         print(f"❌ Error leyendo archivo: {str(e)}")
         return ""
 
-def list_reservations_and_send(listing_id: str, message_template: str):
+def list_reservations_and_send(listing_id: str, message_template: str, profiler: Optional[RunProfiler] = None,
+                               transport: Optional[HttpTransport] = None):
     """Lista reservas y envía mensajes directamente"""
     
-    processor = MessageProcessor()
+    processor = MessageProcessor(transport=transport)
     
     try:
         print(f"🔍 Buscando reservas futuras para listing {listing_id}...")
@@ -871,13 +3079,13 @@ def list_reservations_and_send(listing_id: str, message_template: str):
         print("-" * 80)
         
         for i, booking in enumerate(future_bookings, 1):
-            booking_id = booking["id"]
+            booking_id = booking.id
             guest_name = processor._extract_guest_name(booking)
-            checkin = booking.get("checkIn", "N/A")
-            checkout = booking.get("checkOut", "N/A")
-            guests = booking.get("guests", "N/A")
-            status = booking.get("status", "N/A")
-            source = booking.get("source", "N/A")
+            checkin = booking.checkin or "N/A"
+            checkout = booking.checkout or "N/A"
+            guests = booking.guests if booking.guests is not None else "N/A"
+            status = booking.status or "N/A"
+            source = booking.source or "N/A"
             
             print(f"{i:2d}. {guest_name} - Reserva #{booking_id}")
             print(f"    Check-in: {checkin} | Check-out: {checkout}")
@@ -890,23 +3098,31 @@ def list_reservations_and_send(listing_id: str, message_template: str):
         
         # Mostrar preview de un mensaje procesado
         if future_bookings:
-            print(f"\n📝 Preview del mensaje procesado (reserva {future_bookings[0]['id']}):")
-            preview_message = processor.process_message(message_template, future_bookings[0])
-            print(f"   {preview_message}")
+            print(f"\n📝 Preview del mensaje procesado (reserva {future_bookings[0].id}):")
+            try:
+                preview_message = processor.process_message(message_template, future_bookings[0])
+                print(f"   {preview_message}")
+            except ChekinUnavailableError:
+                print("   Preview no disponible (Chekin no responde)")
         
         # Enviar directamente sin confirmación
         print("\n✅ Enviando mensajes...")
-        result = broadcast_message_to_specific_listing(listing_id, message_template)
+        result = broadcast_message_to_specific_listing(listing_id, message_template, profiler=profiler,
+                                                       transport=transport)
         return result
             
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         return None
 
-def list_all_reservations_and_send(message_template: str):
-    """Lista todas las reservas y envía mensajes directamente usando sistema Parent + Children OPTIMIZADO"""
+def list_all_reservations_and_send(message_template: str, **options):
+    """
+    Lista todas las reservas y envía mensajes directamente usando sistema Parent + Children OPTIMIZADO
     
-    processor = MessageProcessor()
+    Las opciones adicionales se pasan a broadcast_message_to_all_future_bookings.
+    """
+    
+    processor = MessageProcessor(transport=options.get("transport"))
     
     try:
         print("🔍 Verificando conectividad y configuración...")
@@ -942,7 +3158,7 @@ def list_all_reservations_and_send(message_template: str):
         
         # PASAR LOS IDs YA OBTENIDOS para evitar recaptura
         print("\n✅ Iniciando envío paso a paso con sistema Parent + Children...")
-        result = broadcast_message_to_all_future_bookings(message_template, listing_data=listing_data)
+        result = broadcast_message_to_all_future_bookings(message_template, listing_data=listing_data, **options)
         return result
             
     except Exception as e:
@@ -950,6 +3166,50 @@ def list_all_reservations_and_send(message_template: str):
         return None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hostify Broadcast Message System")
+    parser.add_argument("--profile", action="store_true",
+                        help="Mide tiempo real, CPU y memoria por etapa y muestra el desglose al final")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Con --profile, registra también memoria con tracemalloc")
+    parser.add_argument("--cprofile", metavar="ARCHIVO",
+                        help="Con --profile, guarda un perfil cProfile en ARCHIVO (.prof)")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE",
+                                help="Graba las peticiones reales (sin secretos) en CASSETTE; no envía mensajes")
+    cassette_group.add_argument("--replay", metavar="CASSETTE",
+                                help="Reproduce CASSETTE sin red; no envía mensajes")
+    parser.add_argument("--replay-latency", type=float, default=1.0, metavar="FACTOR",
+                        help="Con --replay, factor sobre la latencia grabada (0 = sin espera)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Duplica los GETs que tardan más del p95 de su endpoint (máx. 5%% de carga extra)")
+    parser.add_argument("--plan", action="store_true",
+                        help="Opción 2: estima llamadas por endpoint y duración sin enviar nada")
+    parser.add_argument("--budget", metavar="ENDPOINT=N,...",
+                        help="Máximo de llamadas por endpoint, p. ej. reservations=500,detail=2000,inbox_reply=300")
+    parser.add_argument("--skip-messaged", action="store_true",
+                        help="Indexa el inbox y no envía a hilos que ya tienen el mensaje")
+    parser.add_argument("--full-scan", action="store_true",
+                        help="Consulta también los listings que nunca tienen reservas")
+    parser.add_argument("--accounts", metavar="JSON",
+                        help="Archivo JSON con una lista de cuentas (ver Account.from_config) para procesarlas a la vez")
+    parser.add_argument("--max-concurrent-requests", type=int, default=8,
+                        help="Con --accounts, peticiones en paralelo entre todas las cuentas")
+    args = parser.parse_args()
+    
+    call_budget = None
+    if args.budget:
+        call_budget = {}
+        for item in args.budget.split(","):
+            endpoint, _, limit = item.partition("=")
+            call_budget[endpoint.strip()] = int(limit)
+    
+    profiler = RunProfiler(enabled=args.profile, trace_memory=args.profile_memory, cprofile_path=args.cprofile)
+    transport = None
+    if args.record:
+        transport = RecordingTransport(args.record)
+    elif args.replay and not args.accounts:
+        transport = ReplayTransport(args.replay, latency_scale=args.replay_latency)
+    
     print("🏠 HOSTIFY BROADCAST MESSAGE SYSTEM v2.0")
     print("📡 Usando datos reales de APIs (sin variables Hostify)")
     print("=" * 60)
@@ -1017,7 +3277,7 @@ if __name__ == "__main__":
                         message_template = custom_message
                 
                 print(f"\n🎯 Enviando a listing: {listing_id}")
-                list_reservations_and_send(listing_id, message_template)
+                list_reservations_and_send(listing_id, message_template, profiler=profiler, transport=transport)
                 break
                 
             elif opcion == "2":
@@ -1027,12 +3287,42 @@ if __name__ == "__main__":
                     if custom_message:
                         message_template = custom_message
                 
+                accounts = []
+                if args.accounts:
+                    with open(args.accounts, 'r', encoding='utf-8') as f:
+                        accounts = [Account.from_config(config) for config in json.load(f)]
+                    # Un cassette por cuenta al grabar/reproducir
+                    for account in accounts:
+                        if args.record:
+                            account.transport = RecordingTransport(tagged_path(args.record, account.name))
+                        elif args.replay:
+                            account.transport = ReplayTransport(tagged_path(args.replay, account.name),
+                                                                latency_scale=args.replay_latency)
+                campaign = Campaign("default", message_template, progress_file="broadcast_progress.json")
+                
+                if args.plan:
+                    for account in accounts or [None]:
+                        plan_broadcast([campaign], force_full_scan=args.full_scan, call_budget=call_budget,
+                                       transport=account.transport if account else transport,
+                                       account=account.name if account else None,
+                                       hostify_api_key=account.hostify_api_key if account else None,
+                                       chekin_api_key=account.chekin_api_key if account else None)
+                    break
+                
                 print(f"\n🌐 ENVIANDO A TODAS LAS PROPIEDADES")
                 print("⚠️ Esto enviará mensajes a todas las reservas futuras!")
                 
                 # Eliminar confirmación extra también
                 print("\n✅ Iniciando envío...")
-                list_all_reservations_and_send(message_template)
+                if accounts:
+                    broadcast_accounts(accounts, [campaign], max_concurrent_requests=args.max_concurrent_requests,
+                                       profiler=profiler, force_full_scan=args.full_scan,
+                                       hedge_requests=args.hedge, call_budget=call_budget,
+                                       skip_already_messaged=args.skip_messaged)
+                else:
+                    list_all_reservations_and_send(message_template, profiler=profiler, transport=transport,
+                                                   force_full_scan=args.full_scan, hedge_requests=args.hedge,
+                                                   call_budget=call_budget, skip_already_messaged=args.skip_messaged)
                 break
             
             else: